@@ -0,0 +1,60 @@
+"""Memory used by the logging buffers at 100k buffered messages.
+
+Compares a list of `MessageLogEntry` tuples to a `ColumnarBatch`.
+Run from the repository root with `python -m benchmarks.logging_buffers`.
+"""
+
+import gc
+import random
+import string
+import tracemalloc
+
+from collections.abc import Callable, Iterator
+from typing import Any
+
+from cogs.logging.columnar import ColumnarBatch
+from cogs.logging.core import MessageLogEntry
+
+
+MESSAGES = 100_000
+SNOWFLAKE = 1 << 60
+
+
+def generate_entries(count: int, *, seed: int = 0) -> Iterator[MessageLogEntry]:
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(2048)]
+
+    for i in range(count):
+        yield MessageLogEntry(
+            rng.randrange(SNOWFLAKE),
+            SNOWFLAKE + i,
+            rng.randrange(SNOWFLAKE),
+            rng.randrange(SNOWFLAKE),
+            " ".join(rng.choices(words, k=rng.randint(1, 16))),
+            rng.random() < 0.05,
+        )
+
+
+def measure(build: Callable[[], Any]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main() -> None:
+    results = {
+        "list[MessageLogEntry]": measure(lambda: list(generate_entries(MESSAGES))),
+        "ColumnarBatch": measure(lambda: ColumnarBatch(MessageLogEntry, generate_entries(MESSAGES))),
+    }
+
+    for name, size in results.items():
+        print(f"{name:<24} {size / 1024 ** 2:>8.2f} MiB {size / MESSAGES:>8.1f} bytes/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Throughput of `Logging.on_member_update` over a stream of presence updates.
+
+Updates are generated for a population of members of which only a few have
+opted in to logging, as in a real guild. Members share up to `GUILDS` guilds
+with the bot, so each change is repeated once per shared guild. A stream can
+be recorded to a file and replayed later so different versions of the handler
+see the same events.
+
+Run from the repository root with `python -m benchmarks.presence_updates`,
+pass `--record PATH` to save the generated stream or `--replay PATH` to use a
+saved one.
+"""
+
+import argparse
+import json
+import random
+import time
+
+from collections.abc import Iterable, Iterator
+from types import SimpleNamespace
+from typing import Any, NamedTuple
+
+import discord
+
+from cogs.logging.core import Logging
+from cogs.logging.optin import OptInCache
+from cogs.logging.presence import PresenceTracker
+
+
+EVENTS = 500_000
+MEMBERS = 50_000
+OPTED_IN = 0.01
+GUILDS = 3
+
+STATUSES = ("online", "idle", "dnd", "offline")
+ACTIVITIES = ("playing", "listening", "watching", "custom", "streaming")
+
+
+class PresenceEvent(NamedTuple):
+    user_id: int
+    before_status: str
+    after_status: str
+    before_activities: tuple[str, ...]
+    after_activities: tuple[str, ...]
+
+
+def generate_events(
+    count: int, *, members: int = MEMBERS, guilds: int = GUILDS, seed: int = 0
+) -> Iterator[PresenceEvent]:
+    """Presence updates where roughly half change status and the rest only change activities."""
+    rng = random.Random(seed)
+    state = {}
+
+    for _ in range(count):
+        user_id = rng.randrange(members)
+        status, activities = state.get(user_id, ("online", ()))
+
+        if rng.random() < 0.5:
+            new_status = rng.choice([s for s in STATUSES if s != status])
+            new_activities = activities
+        else:
+            new_status = status
+            weights = [10, 6, 3, 5, 1]
+            new_activities = tuple(sorted(set(rng.choices(ACTIVITIES, weights, k=rng.randint(0, 2)))))
+
+        state[user_id] = (new_status, new_activities)
+        event = PresenceEvent(user_id, status, new_status, activities, new_activities)
+        for _ in range(1 + user_id % guilds):
+            yield event
+
+
+def record(events: Iterable[PresenceEvent], path: str) -> int:
+    count = 0
+    with open(path, "w") as fp:
+        for event in events:
+            fp.write(json.dumps(event) + "\n")
+            count += 1
+    return count
+
+
+def replay(path: str) -> Iterator[PresenceEvent]:
+    with open(path) as fp:
+        for line in fp:
+            user_id, before_status, after_status, before_activities, after_activities = json.loads(line)
+            yield PresenceEvent(
+                user_id, before_status, after_status, tuple(before_activities), tuple(after_activities)
+            )
+
+
+def as_members(event: PresenceEvent) -> tuple[Any, Any]:
+    """Lightweight stand-ins for the members the gateway would pass to the listener."""
+
+    def member(status: str, activities: tuple[str, ...]) -> SimpleNamespace:
+        return SimpleNamespace(
+            id=event.user_id,
+            status=discord.Status[status],
+            activities=[SimpleNamespace(type=discord.ActivityType[activity]) for activity in activities],
+        )
+
+    return member(event.before_status, event.before_activities), member(event.after_status, event.after_activities)
+
+
+class StubBuffers:
+    def __init__(self):
+        self.appended = 0
+
+    def append(self, name: str, entry: tuple) -> bool:
+        self.appended += 1
+        return True
+
+
+def make_cog(members: int, opted_in: float, *, seed: int = 0) -> Any:
+    """A stand-in for the logging cog with only what the listener uses."""
+    rng = random.Random(seed)
+    opt_ins = OptInCache()
+    opt_ins.load(
+        {"user_id": user_id, "public": False, "nsfw": False} for user_id in range(members) if rng.random() < opted_in
+    )
+
+    cog = SimpleNamespace(bot=SimpleNamespace(_log_buffers=StubBuffers()))
+    cog._opt_ins = opt_ins
+    cog._opted_in = opt_ins.entries
+    cog._presence = PresenceTracker(window=2, max_users=members)
+    return cog
+
+
+def run(cog: Any, updates: list[tuple[Any, Any]]) -> float:
+    """Feed every update to the listener, returning the events handled per second."""
+    handler = Logging.on_member_update
+
+    start = time.perf_counter()
+    for before, after in updates:
+        # The listener never awaits, so it can be driven without an event loop
+        try:
+            handler(cog, before, after).send(None)
+        except StopIteration:
+            pass
+    return len(updates) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--record", metavar="PATH", help="save the generated stream and exit")
+    parser.add_argument("--replay", metavar="PATH", help="replay a saved stream")
+    args = parser.parse_args()
+
+    if args.record:
+        count = record(generate_events(EVENTS), args.record)
+        print(f"Recorded {count} presence updates to {args.record}")
+        return
+
+    events = replay(args.replay) if args.replay else generate_events(EVENTS)
+    updates = [as_members(event) for event in events]
+
+    # Best of three, each with a fresh cog so the same entries are buffered every time
+    rate = 0.0
+    for _ in range(3):
+        cog = make_cog(MEMBERS, OPTED_IN)
+        rate = max(rate, run(cog, updates))
+    print(f"{len(updates)} updates, {len(cog._opted_in)} of {MEMBERS} members opted in")
+    print(f"{rate:>12,.0f} events/s, {cog.bot._log_buffers.appended} status entries buffered")
+    print(f"{cog._presence.coalesced} repeats coalesced, {cog._presence.unchanged} unchanged")
+
+
+if __name__ == "__main__":
+    main()
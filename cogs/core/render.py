@@ -0,0 +1,191 @@
+import asyncio
+import importlib
+import multiprocessing
+
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Literal, NamedTuple, TypeVar
+
+from discord.ext import commands
+
+from ditto import BotBase, Cog, Context, CONFIG as BOT_CONFIG
+
+
+CONFIG = BOT_CONFIG.EXTENSIONS[__name__]
+
+T = TypeVar("T")
+
+
+def _initialise(modules: tuple[str, ...]) -> None:
+    """Runs once in each worker, calling `preload` in each module so fonts and images are loaded a single time."""
+    for name in modules:
+        module = importlib.import_module(name)
+        preload = getattr(module, "preload", None)
+        if preload is not None:
+            preload()
+
+
+class RenderJob(NamedTuple):
+    call: Callable[[], Any]
+    future: asyncio.Future
+
+
+class RenderService:
+    """Renders images in a pool of worker processes, keeping CPU heavy work off the event loop.
+
+    Jobs are queued per user and handed to the workers round robin, so a user
+    submitting many jobs only delays their own. No more jobs are submitted to the
+    pool than there are workers, so the queue here is the only one.
+
+    Render functions and their arguments must be picklable, which means module
+    level functions taking plain data. If a worker dies the pool is replaced, only
+    the jobs running at the time fail.
+    """
+
+    def __init__(self, *, workers: int, max_queued: int, max_per_user: int, preload: Iterable[str] = ()):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.preload = tuple(preload)
+        self.executor = self._create_executor()
+
+        self._queues: OrderedDict[int, deque[RenderJob]] = OrderedDict()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            self.workers,
+            # Forking would copy the running event loop and its threads into each worker
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialise,
+            initargs=(self.preload,),
+        )
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        # Every job running in a broken pool fails, so only the first to notice replaces it
+        if executor is self.executor:
+            self.restarts += 1
+            executor.shutdown(wait=False)
+            self.executor = self._create_executor()
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, jobs still queued are cancelled and running jobs are left to finish."""
+        for queue in self._queues.values():
+            for job in queue:
+                job.future.cancel()
+        self._queues.clear()
+        self.queued = 0
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def users(self) -> int:
+        return len(self._queues)
+
+    async def render(self, user_id: int, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a render function in a worker process on behalf of a user."""
+        queue = self._queues.get(user_id)
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            raise commands.BadArgument("Too many images are being rendered right now, please try again later.")
+        if queue is not None and len(queue) >= self.max_per_user:
+            self.rejected += 1
+            raise commands.BadArgument("You already have images waiting to be rendered, please wait for them first.")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(RenderJob(partial(func, *args, **kwargs), future))
+        self.queued += 1
+
+        self._dispatch()
+        return await future
+
+    def _dispatch(self) -> None:
+        while self.running < self.workers and self._queues:
+            # Take the next job of the user at the front, then move them to the back
+            user_id, queue = self._queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                self._queues[user_id] = queue
+            self.queued -= 1
+
+            # The command was cancelled while waiting
+            if job.future.done():
+                continue
+
+            try:
+                result = self.executor.submit(job.call)
+            except BrokenProcessPool:
+                # A worker died while the pool was idle
+                self._restart(self.executor)
+                result = self.executor.submit(job.call)
+
+            self.running += 1
+            result.add_done_callback(partial(self._done, job, self.executor))
+
+    def _done(self, job: RenderJob, executor: ProcessPoolExecutor, result: Future) -> None:
+        # Called from the executor's thread, the event loop is only touched through call_soon_threadsafe
+        job.future.get_loop().call_soon_threadsafe(self._complete, job, executor, result)
+
+    def _complete(self, job: RenderJob, executor: ProcessPoolExecutor, result: Future) -> None:
+        self.running -= 1
+        exception = result.exception()
+        if exception is not None:
+            self.failed += 1
+            if isinstance(exception, BrokenProcessPool):
+                self._restart(executor)
+        else:
+            self.completed += 1
+
+        if not job.future.done():
+            if exception is not None:
+                job.future.set_exception(exception)
+            else:
+                job.future.set_result(result.result())
+
+        self._dispatch()
+
+
+class RenderBot(BotBase):
+    _render: Literal[True]
+    _render_service: RenderService
+
+
+class Render(Cog):
+    def __init__(self, bot: RenderBot):
+        self.bot = bot
+
+    def cog_unload(self):
+        # The service is recreated when the extension is loaded again
+        self.bot._render_service.shutdown()
+        del self.bot._render_service
+        del self.bot._render
+
+    @commands.command(name="render_queue")
+    @commands.is_owner()
+    async def render_queue(self, ctx: Context):
+        """Show the state of the render workers."""
+        service = self.bot._render_service
+        await ctx.send(
+            f"{service.running}/{service.workers} workers busy, {service.queued} jobs queued for "
+            f"{service.users} users. {service.completed} completed, {service.failed} failed, "
+            f"{service.rejected} rejected, {service.restarts} pool restarts."
+        )
+
+
+def setup(bot: RenderBot):
+    if not hasattr(bot, "_render"):
+        bot._render = True
+        bot._render_service = RenderService(
+            workers=CONFIG.WORKERS,
+            max_queued=CONFIG.MAX_QUEUED,
+            max_per_user=CONFIG.MAX_PER_USER,
+            preload=CONFIG.PRELOAD,
+        )
+    bot.add_cog(Render(bot))
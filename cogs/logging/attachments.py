@@ -0,0 +1,151 @@
+import asyncio
+import codecs
+import logging
+
+from collections import Counter
+from collections.abc import Callable
+from typing import NamedTuple, Optional
+
+import aiohttp
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentJob(NamedTuple):
+    message_id: int
+    index: int
+    url: str
+    size: int
+    charset: str
+
+
+class ByteBudget:
+    """Limits the number of bytes in flight, a single request larger than the limit may run alone.
+
+    Requests are admitted by their declared size, bytes received beyond that are
+    charged with :meth:`charge` without waiting so a running download never stalls.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size: int) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.used == 0 or self.used + size <= self.limit)
+            self.used += size
+
+    def charge(self, size: int) -> None:
+        self.used += size
+
+    async def release(self, size: int) -> None:
+        async with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+
+class AttachmentFetcher:
+    """A bounded pool of workers which download and decode text attachments.
+
+    Jobs are queued without blocking the caller, attachments over `max_file_bytes`
+    are skipped and at most `max_inflight_bytes` are downloaded at once. Content
+    is decoded incrementally as it streams in, and `callback` is called with
+    the job and its decoded content once the download completes. Errors are
+    logged and never stop a worker.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[AttachmentJob, str], None],
+        *,
+        loop: asyncio.AbstractEventLoop,
+        log: logging.Logger,
+        workers: int,
+        max_file_bytes: int,
+        max_inflight_bytes: int,
+        max_queued: int,
+    ):
+        self.callback = callback
+        self.log = log
+        self.max_file_bytes = max_file_bytes
+
+        self.queue: asyncio.Queue[AttachmentJob] = asyncio.Queue(max_queued)
+        self.budget = ByteBudget(max_inflight_bytes)
+        self.skipped: Counter[str] = Counter()
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._workers = [loop.create_task(self._worker()) for _ in range(workers)]
+
+    def submit(self, job: AttachmentJob) -> bool:
+        """Queue an attachment to be fetched, returns whether it was accepted."""
+        if job.size > self.max_file_bytes:
+            self.skipped["too_large"] += 1
+            return False
+
+        try:
+            codecs.lookup(job.charset)
+        except LookupError:
+            self.skipped["unknown_charset"] += 1
+            return False
+
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.skipped["queue_full"] += 1
+            return False
+        return True
+
+    async def _fetch(self, job: AttachmentJob) -> Optional[str]:
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+
+        decoder = codecs.getincrementaldecoder(job.charset)()
+        parts: list[str] = []
+        received = 0
+
+        await self.budget.acquire(job.size)
+        charged = job.size
+        try:
+            async with self._session.get(job.url) as response:
+                if response.status != 200:
+                    self.skipped["http_error"] += 1
+                    return None
+
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > self.max_file_bytes:
+                        self.skipped["too_large"] += 1
+                        return None
+                    # The declared size can be wrong, charge whatever arrives beyond it
+                    if received > charged:
+                        self.budget.charge(received - charged)
+                        charged = received
+                    parts.append(decoder.decode(chunk))
+        finally:
+            await self.budget.release(charged)
+
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                content = await self._fetch(job)
+                if content is not None:
+                    self.callback(job, content)
+            except (UnicodeDecodeError, aiohttp.ClientError, asyncio.TimeoutError):
+                self.skipped["failed"] += 1
+            except Exception:
+                self.skipped["failed"] += 1
+                self.log.exception(f"Failed to fetch attachment {job.index} of message {job.message_id}")
+            finally:
+                self.queue.task_done()
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,105 @@
+import os
+
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageChops, ImageDraw
+
+
+def circular_avatar(avatar_fp: BytesIO, size: int) -> Image.Image:
+    """Decode an avatar, resize it and mask it to a circle."""
+    avatar = Image.open(avatar_fp)
+    if avatar.mode != "RGBA":
+        avatar = avatar.convert("RGBA")
+    avatar = avatar.resize((size, size), resample=Image.LANCZOS)
+
+    # Apply circular mask to image
+    _, _, _, alpha = avatar.split()
+    if alpha.mode != "L":
+        alpha = alpha.convert("L")
+
+    mask = Image.new("L", avatar.size, 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((0, 0) + avatar.size, fill=255)
+
+    mask = ImageChops.darker(mask, alpha)
+    avatar.putalpha(mask)
+
+    return avatar
+
+
+class AvatarCache:
+    """Masked avatars stored on disk as raw RGBA, keyed by avatar hash and size.
+
+    Avatar hashes change whenever an avatar does, so entries never need to be invalidated.
+    Files are shared between processes, reading one marks it as recently used and the least
+    recently used files are removed once the cache passes `max_bytes`.
+    """
+
+    def __init__(self, path: str, *, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._bytes: Optional[int] = None
+
+    def _file(self, key: str, size: int) -> str:
+        return os.path.join(self.path, f"{key}_{size}.rgba")
+
+    def has(self, key: str, size: int) -> bool:
+        return os.path.exists(self._file(key, size))
+
+    def get(self, key: str, size: int) -> Optional[Image.Image]:
+        path = self._file(key, size)
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+            os.utime(path)
+        except OSError:
+            return None
+
+        if len(data) != size * size * 4:
+            return None
+        return Image.frombytes("RGBA", (size, size), data)
+
+    def put(self, key: str, size: int, avatar: Image.Image) -> None:
+        data = avatar.tobytes()
+        if len(data) > self.max_bytes:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        path = self._file(key, size)
+
+        # Written then renamed as other processes read the same directory
+        with open(f"{path}.{os.getpid()}.tmp", "wb") as fp:
+            fp.write(data)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+        if self._bytes is None:
+            self._bytes = self._prune()
+        self._bytes += len(data)
+        if self._bytes > self.max_bytes:
+            self._bytes = self._prune()
+
+    def _prune(self) -> int:
+        """Remove the least recently used avatars until the cache is back under its limit.
+
+        Returns the size of the remaining avatars.
+        """
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith(".rgba"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        return total
@@ -0,0 +1,388 @@
+import asyncio
+import os
+import pickle
+import threading
+import time
+
+from collections import Counter
+from collections.abc import Iterator
+from typing import Any, BinaryIO, Generic, Literal, NamedTuple, Optional, TypeVar, get_type_hints
+
+from .columnar import ColumnarBatch
+from .spool import Spool
+
+
+OverflowPolicy = Literal["drop", "spill"]
+OVERFLOW_POLICIES: tuple[OverflowPolicy, ...] = ("drop", "spill")
+
+FIELD_SIZE = 8
+
+T = TypeVar("T", bound=tuple)
+
+Batch = dict[str, ColumnarBatch]
+
+
+def entry_size(entry: tuple) -> int:
+    """An estimate of the number of bytes a buffered entry occupies in a columnar batch."""
+    return FIELD_SIZE * len(entry) + sum(len(value) for value in entry if isinstance(value, (str, bytes)))
+
+
+def encode_entry(entry: tuple) -> tuple:
+    """Converts an entry to a tuple of picklable values, enums are stored by name."""
+    return tuple(getattr(value, "name", value) for value in entry)
+
+
+def decode_entry(entry_type: type[T], values: tuple) -> T:
+    """Rebuilds an entry previously encoded with :func:`encode_entry`."""
+    hints = get_type_hints(entry_type)
+    return entry_type(
+        *(
+            hints[field].try_value(value) if hasattr(hints[field], "try_value") else value
+            for field, value in zip(entry_type._fields, values)  # type: ignore
+        )
+    )
+
+
+class LogBuffer(Generic[T]):
+    """An in-memory columnar buffer of entries waiting to be flushed to the database."""
+
+    def __init__(self, name: str, entry_type: type[T]):
+        self.name = name
+        self.entry_type = entry_type
+        self.entries: ColumnarBatch[T] = ColumnarBatch(entry_type)
+        self.bytes = 0
+        self.first_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __bool__(self) -> bool:
+        return bool(self.entries)
+
+    def __iter__(self) -> Iterator[tuple]:
+        return iter(self.entries)
+
+    @property
+    def age(self) -> float:
+        if self.first_at is None:
+            return 0.0
+        return time.monotonic() - self.first_at
+
+    def append(self, entry: T, size: int) -> None:
+        if self.first_at is None:
+            self.first_at = time.monotonic()
+        self.entries.append(entry)
+        self.bytes += size
+
+    def take(self) -> ColumnarBatch[T]:
+        entries, self.entries = self.entries, ColumnarBatch(self.entry_type)
+        self.bytes = 0
+        self.first_at = None
+        return entries
+
+    def restore(self, entries: ColumnarBatch[T]) -> None:
+        self.entries = entries + self.entries
+        self.bytes += sum(entry_size(entry) for entry in entries)
+        if self.first_at is None:
+            self.first_at = time.monotonic()
+
+
+class FlushPolicy(NamedTuple):
+    max_rows: int
+    max_bytes: int
+    max_age: float
+    min_interval: float
+    batch_rows: int
+    max_total_bytes: int
+    overflow: OverflowPolicy
+    spill_path: str
+
+
+class BufferManager:
+    """Manages the logging buffers and decides when they should be flushed.
+
+    A flush is due once any buffer passes the configured row count, byte size
+    or age. The age limit shrinks as the incoming event rate grows, so each
+    flush carries roughly `batch_rows` entries rather than always waiting for
+    `max_age`.
+
+    When the total buffered size passes `max_total_bytes` the overflow policy
+    is applied, `drop` discards new entries while `spill` moves the buffered
+    entries to a local file which is drained on the next flush. Spills are
+    written in order off the event loop.
+
+    If a :class:`Spool` is given every accepted entry is written to it before
+    being buffered, so entries which have not been flushed survive a restart.
+    Spooled entries are released once they are flushed or spilled, so they are
+    never replayed from both.
+    """
+
+    RATE_SMOOTHING = 0.3
+
+    def __init__(self, policy: FlushPolicy, *buffers: tuple[str, type[tuple]], spool: Optional[Spool] = None):
+        self.policy = policy
+        self.spool = spool
+        self.buffers: dict[str, LogBuffer] = {name: LogBuffer(name, entry_type) for name, entry_type in buffers}
+
+        self.enqueued: Counter[str] = Counter()
+        self.dropped: Counter[str] = Counter()
+        self.spilled: Counter[str] = Counter()
+
+        self.rate = 0.0
+        self._rate_count = 0
+        self._rate_at = time.monotonic()
+
+        self._due = asyncio.Event()
+
+        # Spill writes run in the executor, the lock keeps them from racing a drain of the same file
+        self._spilling: Optional[asyncio.Task] = None
+        self._spill_lock = threading.Lock()
+
+        # The spool checkpoint of the batch being flushed, and a release held back until spills finish
+        self._flushing: Optional[int] = None
+        self._deferred_release: Optional[int] = None
+
+        self._recover_spill()
+
+    def __getitem__(self, name: str) -> LogBuffer:
+        return self.buffers[name]
+
+    @property
+    def bytes(self) -> int:
+        return sum(buffer.bytes for buffer in self.buffers.values())
+
+    @property
+    def rows(self) -> int:
+        return sum(len(buffer) for buffer in self.buffers.values())
+
+    @property
+    def interval(self) -> float:
+        """The current age limit, adapted to the incoming event rate."""
+        if self.rate <= 0:
+            return self.policy.max_age
+        return min(self.policy.max_age, max(self.policy.min_interval, self.policy.batch_rows / self.rate))
+
+    @property
+    def has_spill(self) -> bool:
+        return os.path.exists(self.policy.spill_path)
+
+    def _update_rate(self) -> None:
+        self._rate_count += 1
+        now = time.monotonic()
+        elapsed = now - self._rate_at
+        if elapsed >= 1:
+            rate = self._rate_count / elapsed
+            self.rate = self.RATE_SMOOTHING * rate + (1 - self.RATE_SMOOTHING) * self.rate
+            self._rate_count = 0
+            self._rate_at = now
+
+    def append(self, name: str, entry: tuple) -> bool:
+        """Add an entry to a buffer, returns whether the entry was accepted."""
+        buffer = self.buffers[name]
+        size = entry_size(entry)
+        self._update_rate()
+
+        if self.bytes + size > self.policy.max_total_bytes:
+            if self.policy.overflow == "spill":
+                self.spill()
+            else:
+                self.dropped[name] += 1
+                self._due.set()
+                return False
+
+        if self.spool is not None:
+            self.spool.write(name, encode_entry(entry))
+
+        buffer.append(entry, size)
+        self.enqueued[name] += 1
+
+        if len(buffer) >= self.policy.max_rows or buffer.bytes >= self.policy.max_bytes:
+            self._due.set()
+
+        return True
+
+    def due(self) -> bool:
+        if self._due.is_set() or self.has_spill:
+            return True
+        interval = self.interval
+        return any(buffer.age >= interval for buffer in self.buffers.values())
+
+    async def wait(self) -> None:
+        """Wait until a flush is due."""
+        while not self.due():
+            if self.spool is not None:
+                await self.spool.sync()
+            try:
+                await asyncio.wait_for(self._due.wait(), timeout=self.policy.min_interval)
+            except asyncio.TimeoutError:
+                pass
+        self._due.clear()
+
+        # Spilled entries are only in the spill file once the write finishes
+        if self._spilling is not None:
+            await asyncio.wait([self._spilling])
+
+    def take(self) -> Batch:
+        return {name: buffer.take() for name, buffer in self.buffers.items() if buffer}
+
+    def restore(self, batch: Batch) -> None:
+        """Return the unflushed remainder of a batch to the front of the buffers."""
+        for name, entries in batch.items():
+            self.buffers[name].restore(entries)
+
+    def _write_spill(self, fp: BinaryIO, batch: Batch) -> None:
+        for name, entries in batch.items():
+            for entry in entries:
+                pickle.dump((name, encode_entry(entry)), fp)
+
+    def _append_spill(self, batch: Batch) -> None:
+        with self._spill_lock, open(self.policy.spill_path, "ab") as fp:
+            self._write_spill(fp, batch)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    async def _spill(self, previous: Optional[asyncio.Task], batch: Batch, checkpoint: Optional[int]) -> None:
+        # Segments before the batch being flushed still hold its entries
+        after = self._flushing or 0
+
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._append_spill, batch)
+        except OSError:
+            # Better over the memory limit than lost, the spool keeps them until they are flushed
+            self.restore(batch)
+            self._deferred_release = None
+            raise
+
+        if checkpoint is not None:
+            self.spool.release(checkpoint, after=after)  # type: ignore
+            if self._spilling is asyncio.current_task() and self._deferred_release is not None:
+                self.spool.release(self._deferred_release)  # type: ignore
+                self._deferred_release = None
+
+    def _release(self, checkpoint: int) -> None:
+        # Earlier segments may hold entries of a spill which hasn't been written yet
+        if self._spilling is not None and not self._spilling.done():
+            self._deferred_release = max(checkpoint, self._deferred_release or 0)
+        else:
+            self.spool.release(checkpoint)  # type: ignore
+
+    def spill(self) -> None:
+        """Move all buffered entries to the spill file, the file is written in the background."""
+        batch = self.take()
+        if not batch:
+            return
+        for name, entries in batch.items():
+            self.spilled[name] += len(entries)
+
+        checkpoint = self.spool.rotate() if self.spool is not None else None
+        self._spilling = asyncio.get_running_loop().create_task(self._spill(self._spilling, batch, checkpoint))
+        self._due.set()
+
+    def _recover_spill(self) -> None:
+        # A drain interrupted by a crash leaves its entries in the draining file, ahead of anything spilled since
+        draining_path = f"{self.policy.spill_path}.draining"
+        if not os.path.exists(draining_path):
+            return
+
+        remaining_path = f"{self.policy.spill_path}.remaining"
+        with open(remaining_path, "wb") as remaining:
+            with open(draining_path, "rb") as fp:
+                while True:
+                    try:
+                        pickle.dump(pickle.load(fp), remaining)
+                    except (EOFError, pickle.UnpicklingError):
+                        break
+            if self.has_spill:
+                with open(self.policy.spill_path, "rb") as newer:
+                    remaining.write(newer.read())
+            remaining.flush()
+            os.fsync(remaining.fileno())
+        os.replace(remaining_path, self.policy.spill_path)
+        os.remove(draining_path)
+
+    def _read_spill(self, fp: BinaryIO) -> Iterator[tuple[str, Any]]:
+        while True:
+            try:
+                name, values = pickle.load(fp)
+            except EOFError:
+                return
+            yield name, decode_entry(self.buffers[name].entry_type, values)
+
+    def drain(self) -> Iterator[Batch]:
+        """Yield batches to flush, spilled entries first as they are always older than buffered entries.
+
+        Consumers should remove entries from each batch as they are flushed and
+        close the generator when done, if the consumer stops early whatever is
+        left is put back.
+        """
+        if self.has_spill:
+            draining_path = f"{self.policy.spill_path}.draining"
+            with self._spill_lock:
+                os.replace(self.policy.spill_path, draining_path)
+
+            batch: Batch = {}
+            rows = 0
+            with open(draining_path, "rb") as fp:
+                entries = self._read_spill(fp)
+                try:
+                    for name, entry in entries:
+                        if name not in batch:
+                            batch[name] = ColumnarBatch(self.buffers[name].entry_type)
+                        batch[name].append(entry)
+                        rows += 1
+                        if rows >= self.policy.max_rows:
+                            yield batch
+                            batch = {}
+                            rows = 0
+                    if batch:
+                        yield batch
+                        batch = {}
+                except GeneratorExit:
+                    # Put the remaining entries back ahead of anything spilled since
+                    remaining_path = f"{self.policy.spill_path}.remaining"
+                    with self._spill_lock, open(remaining_path, "wb") as remaining:
+                        self._write_spill(remaining, batch)
+                        for name, entry in entries:
+                            pickle.dump((name, encode_entry(entry)), remaining)
+                        if self.has_spill:
+                            with open(self.policy.spill_path, "rb") as newer:
+                                remaining.write(newer.read())
+                        remaining.flush()
+                        os.fsync(remaining.fileno())
+                        os.replace(remaining_path, self.policy.spill_path)
+                    os.remove(draining_path)
+                    raise
+
+            os.remove(draining_path)
+
+        batch = self.take()
+        if not batch:
+            return
+
+        checkpoint = self.spool.rotate() if self.spool is not None else None
+        self._flushing = checkpoint
+        try:
+            yield batch
+        finally:
+            self._flushing = None
+            self.restore(batch)
+
+        if checkpoint is not None:
+            self._release(checkpoint)
+
+    def replay(self) -> int:
+        """Buffer the entries left in the spool by a previous process, returns the number replayed."""
+        if self.spool is None:
+            return 0
+
+        count = 0
+        for name, values in self.spool.replay():
+            entry = decode_entry(self.buffers[name].entry_type, values)
+            self.buffers[name].append(entry, entry_size(entry))
+            count += 1
+
+        if count:
+            self._due.set()
+        return count
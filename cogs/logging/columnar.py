@@ -0,0 +1,253 @@
+import datetime
+
+from array import array
+from collections.abc import Iterable, Iterator
+from typing import Any, Generic, TypeVar, get_type_hints
+
+
+T = TypeVar("T", bound=tuple)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class Bitset:
+    """A growable sequence of booleans packed eight to a byte."""
+
+    __slots__ = ("_bits", "_length")
+
+    def __init__(self, values: Iterable[bool] = ()):
+        self._bits = bytearray()
+        self._length = 0
+        for value in values:
+            self.append(value)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> bool:
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return bool(self._bits[index >> 3] & (1 << (index & 7)))
+
+    def __iter__(self) -> Iterator[bool]:
+        for index in range(self._length):
+            yield bool(self._bits[index >> 3] & (1 << (index & 7)))
+
+    def __add__(self, other: "Bitset") -> "Bitset":
+        return Bitset(list(self) + list(other))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    def append(self, value: bool) -> None:
+        if not self._length & 7:
+            self._bits.append(0)
+        if value:
+            self._bits[self._length >> 3] |= 1 << (self._length & 7)
+        self._length += 1
+
+    def sql(self) -> Iterable[bool]:
+        return self
+
+
+class StringArena:
+    """A growable sequence of strings stored back to back in a single UTF-8 buffer."""
+
+    __slots__ = ("_data", "_offsets")
+
+    def __init__(self, values: Iterable[str] = ()):
+        self._data = bytearray()
+        self._offsets = array("q", [0])
+        for value in values:
+            self.append(value)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._data[self._offsets[index] : self._offsets[index + 1]].decode("utf-8", "surrogatepass")
+
+    def __iter__(self) -> Iterator[str]:
+        data, offsets = self._data, self._offsets
+        for index in range(len(offsets) - 1):
+            yield data[offsets[index] : offsets[index + 1]].decode("utf-8", "surrogatepass")
+
+    def __add__(self, other: "StringArena") -> "StringArena":
+        return StringArena([*self, *other])
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._data) + self._offsets.itemsize * len(self._offsets)
+
+    def append(self, value: str) -> None:
+        self._data += value.encode("utf-8", "surrogatepass")
+        self._offsets.append(len(self._data))
+
+    def sql(self) -> Iterable[str]:
+        return self
+
+
+class IntColumn(array):
+    """A growable sequence of 64 bit integers."""
+
+    def __new__(cls, values: Iterable[int] = ()):
+        return super().__new__(cls, "q", values)
+
+    def __add__(self, other: "IntColumn") -> "IntColumn":  # type: ignore
+        return IntColumn([*self, *other])
+
+    @property
+    def nbytes(self) -> int:
+        return self.itemsize * len(self)
+
+    def sql(self) -> Iterable[int]:
+        return self
+
+
+class DatetimeColumn:
+    """A growable sequence of datetimes stored as microseconds since the unix epoch in UTC."""
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values: Iterable[datetime.datetime] = ()):
+        self._values = array("q")
+        for value in values:
+            self.append(value)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, index: int) -> datetime.datetime:
+        return EPOCH + self._values[index] * ONE_MICROSECOND
+
+    def __iter__(self) -> Iterator[datetime.datetime]:
+        for value in self._values:
+            yield EPOCH + value * ONE_MICROSECOND
+
+    def __add__(self, other: "DatetimeColumn") -> "DatetimeColumn":
+        return DatetimeColumn([*self, *other])
+
+    @property
+    def nbytes(self) -> int:
+        return self._values.itemsize * len(self._values)
+
+    def append(self, value: datetime.datetime) -> None:
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        self._values.append((value - EPOCH) // ONE_MICROSECOND)
+
+    def sql(self) -> Iterable[datetime.datetime]:
+        return self
+
+
+class EnumColumn:
+    """A growable sequence of enum members stored as one byte indexes."""
+
+    __slots__ = ("_members", "_indexes", "_values")
+
+    def __init__(self, enum: Any, values: Iterable[Any] = ()):
+        self._members = list(enum)
+        self._indexes = {member: index for index, member in enumerate(self._members)}
+        self._values = array("b")
+        for value in values:
+            self.append(value)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, index: int) -> Any:
+        return self._members[self._values[index]]
+
+    def __iter__(self) -> Iterator[Any]:
+        members = self._members
+        for value in self._values:
+            yield members[value]
+
+    def __add__(self, other: "EnumColumn") -> "EnumColumn":
+        column = EnumColumn(self._members)
+        column._values = self._values + other._values
+        return column
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._values)
+
+    def append(self, value: Any) -> None:
+        self._values.append(self._indexes[value])
+
+    def sql(self) -> Iterable[str]:
+        """Members by name, enum codecs are text only so these are cast in SQL."""
+        return (member.name for member in self)
+
+
+Column = Any
+
+
+def make_column(hint: Any) -> Column:
+    if hint is bool:
+        return Bitset()
+    if hint is int:
+        return IntColumn()
+    if hint is str:
+        return StringArena()
+    if hint is datetime.datetime:
+        return DatetimeColumn()
+    if hasattr(hint, "try_value"):
+        return EnumColumn(hint)
+    raise TypeError(f"Unsupported column type {hint!r}.")
+
+
+class ColumnarBatch(Generic[T]):
+    """Stores entries of a NamedTuple type column by column.
+
+    Integers are kept in :class:`array.array`, booleans in bitsets and strings
+    in a single UTF-8 arena, which avoids the per object overhead of a list of
+    tuples. Rows are only rebuilt lazily when iterated.
+    """
+
+    __slots__ = ("entry_type", "columns")
+
+    def __init__(self, entry_type: type[T], entries: Iterable[T] = ()):
+        self.entry_type = entry_type
+        hints = get_type_hints(entry_type)
+        self.columns: dict[str, Column] = {field: make_column(hints[field]) for field in entry_type._fields}  # type: ignore
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values())))
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[tuple]:
+        return zip(*self.columns.values())
+
+    def __add__(self, other: "ColumnarBatch[T]") -> "ColumnarBatch[T]":
+        batch = ColumnarBatch.__new__(ColumnarBatch)
+        batch.entry_type = self.entry_type
+        batch.columns = {field: column + other.columns[field] for field, column in self.columns.items()}
+        return batch
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+    def append(self, entry: T) -> None:
+        for column, value in zip(self.columns.values(), entry):
+            column.append(value)
+
+    def column(self, field: str) -> Column:
+        return self.columns[field]
+
+    def sql_columns(self) -> list[Iterable[Any]]:
+        """Each column in a form asyncpg can encode."""
+        return [column.sql() for column in self.columns.values()]
+
+    def sql_rows(self) -> Iterator[tuple]:
+        """Lazily rebuilt rows in a form asyncpg can encode."""
+        return zip(*self.sql_columns())
@@ -1,21 +1,59 @@
+import asyncio
 import datetime
+import io
+import os
 import re
+import time
 
-from contextlib import suppress
+from contextlib import closing
 from typing import Literal, NamedTuple, Optional
 
 import asyncpg
-from donphan import MaybeAcquire
+from donphan import MaybeAcquire, Table
 
 import discord
 from discord.ext import commands, tasks
 
-from ditto import BotBase, Cog, Context
-
-from .db import MessageLog, MessageAttachments, MessageEditHistory, OptInStatus, Status, StatusLog
+from ditto import BotBase, Cog, Context, CONFIG as BOT_CONFIG
+
+from .attachments import AttachmentFetcher, AttachmentJob
+from .buffer import Batch, BufferManager, FlushPolicy
+from .columnar import ColumnarBatch
+from .db import (
+    MarkovCorpus,
+    MessageLog,
+    MessageAttachments,
+    MessageEditHistory,
+    OptInStatus,
+    Status,
+    StatusLog,
+    StatusRollup,
+)
+from .flush import FLUSH_MODES, FlushMode, FlushResult, Parent, apply_deletes, apply_edits, flush_records
+from .metrics import Metrics
+from .optin import OptInCache
+from .partitions import (
+    PARTITIONED_TABLES,
+    add_months,
+    drop_partitions,
+    ensure_partitions,
+    get_partitions,
+    is_migrating,
+    is_partitioned,
+    migrate_to_partitioned,
+    month_start,
+)
+from .presence import PresenceTracker
+from .retention import VacuumProgress, vacuum_status_log
+from .spool import Spool
+
+
+CONFIG = BOT_CONFIG.EXTENSIONS[__name__]
 
 TEXT_FILE_REGEX = re.compile(r"^.*; charset=.*$")
 
+MIN_RETENTION_DAYS = 7
+
 
 COLOURS: dict[Optional[Status], tuple[int, int, int, int]] = {  # type: ignore
     None: (0, 0, 0, 0),
@@ -66,28 +104,110 @@ class StatusLogEntry(NamedTuple):
     status: Status
 
 
+STREAMING = discord.ActivityType.streaming
+
+
+FLUSH_TABLES: dict[str, type[Table]] = {
+    "status": StatusLog,
+    "message": MessageLog,
+    "message_attachment": MessageAttachments,
+}
+
+# The message may have been dropped on overflow or never logged, so attachments without one are skipped
+FLUSH_PARENTS: dict[str, Parent] = {
+    "message_attachment": (MessageLog, "message_id"),
+}
+
+
+METRICS = (
+    ("logging_entries_enqueued_total", "counter", "Entries accepted into a buffer."),
+    ("logging_entries_flushed_total", "counter", "Rows written to the database."),
+    ("logging_entries_skipped_total", "counter", "Entries flushed without writing a row."),
+    ("logging_entries_failed_total", "counter", "Entries in flushes which raised, these are retried."),
+    ("logging_entries_dropped_total", "counter", "Entries dropped because the buffers were full."),
+    ("logging_entries_spilled_total", "counter", "Entries spilled to disk because the buffers were full."),
+    ("logging_buffer_rows", "gauge", "Entries waiting to be flushed."),
+    ("logging_buffer_bytes", "gauge", "Approximate size of the entries waiting to be flushed."),
+    ("logging_buffer_flush_seconds", "histogram", "Time taken to flush a single buffer."),
+    ("logging_flush_duration_seconds", "histogram", "Time taken by a flush, including acquiring a connection."),
+    ("logging_pool_acquire_seconds", "histogram", "Time spent waiting for a pool connection."),
+    ("logging_presence_tracked_users", "gauge", "Users whose last status is held in memory."),
+    ("logging_presence_changes_total", "counter", "Presence updates which changed a user's logged status."),
+    ("logging_presence_coalesced_total", "counter", "Repeats of a status change from other guilds, dropped early."),
+    ("logging_presence_unchanged_total", "counter", "Presence updates which left a user's logged status unchanged."),
+    ("logging_presence_evicted_total", "counter", "Users forgotten to keep the presence tracker in size."),
+)
+
+
+def is_streaming(member: discord.Member) -> bool:
+    return any(activity.type is STREAMING for activity in member.activities)
+
+
+def member_status(member: discord.Member) -> Optional[Status]:
+    """The status to log for a member, None if their status isn't logged."""
+    # Handle streaming edge case
+    if is_streaming(member):
+        status = Status.streaming
+    else:
+        status = Status.try_value(member.status.name)
+
+    if status not in COLOURS:
+        return None
+    return status
+
+
 class LoggingBot(BotBase):
     _logging: Literal[True]
-    _message_log: list[MessageLogEntry]
-    _message_delete_log: list[MessageDeleteLogEntry]
-    _message_attachment_log: list[MessageAttachmentLogEntry]
-    _message_update_log: list[MessageUpdateLogEntry]
-    _status_log: list[StatusLogEntry]
-    _last_status: dict[int, Status]
+    _log_buffers: BufferManager
+    _log_metrics: Metrics
+    _log_migrating: set[str]
+    _log_opt_ins: OptInCache
+    _log_presence: PresenceTracker
 
 
 class Logging(Cog):
     def __init__(self, bot: LoggingBot):
         self.bot = bot
 
-        self._opted_in: set[int] = set()
-        self._log_nsfw: set[int] = set()
+        self._opt_ins = bot._log_opt_ins
+        self._opted_in = self._opt_ins.entries
+        self._presence = bot._log_presence
+
+        self._attachments = AttachmentFetcher(
+            self._on_attachment_fetched,
+            loop=self.bot.loop,
+            log=self.bot.log,
+            workers=CONFIG.ATTACHMENT_WORKERS,
+            max_file_bytes=CONFIG.ATTACHMENT_MAX_BYTES,
+            max_inflight_bytes=CONFIG.ATTACHMENT_MAX_INFLIGHT_BYTES,
+            max_queued=CONFIG.ATTACHMENT_MAX_QUEUED,
+        )
+
+        self._flush_mode: FlushMode = CONFIG.FLUSH_MODE
+        self._flush_results: dict[tuple[str, FlushMode], FlushResult] = {}
+        self._flush_lock = asyncio.Lock()
+
+        self._vacuum: Optional[VacuumProgress] = None
+        self._vacuum_task: Optional[asyncio.Task] = None
 
         self._logging_task.add_exception_type(asyncpg.exceptions.PostgresConnectionError)
         self._logging_task.start()
+        self._partition_task.start()
+        self._vacuum_schedule.add_exception_type(asyncpg.exceptions.PostgresConnectionError)
+        self._vacuum_schedule.start()
 
     def cog_unload(self):
         self._logging_task.stop()
+        self._partition_task.cancel()
+        self._vacuum_schedule.cancel()
+        if self._vacuum_task is not None:
+            self._vacuum_task.cancel()
+        self.bot.loop.create_task(self._attachments.close())
+
+    def _on_attachment_fetched(self, job: AttachmentJob, content: str) -> None:
+        self.bot._log_buffers.append(
+            "message_attachment", MessageAttachmentLogEntry(job.message_id, job.index, content)
+        )
 
     @commands.group(name="logging")
     async def logging(self, ctx: Context):
@@ -100,7 +220,7 @@ class Logging(Cog):
         async with ctx.db as connection:
             await OptInStatus.is_not_opted_in(connection, ctx)
             await OptInStatus.insert(connection, user_id=ctx.author.id)
-            self._opted_in.add(ctx.author.id)
+            self._opt_ins.add(ctx.author.id)
 
         await ctx.tick()
 
@@ -110,7 +230,8 @@ class Logging(Cog):
         async with ctx.db as connection:
             await OptInStatus.is_opted_in(connection, ctx)
             await OptInStatus.delete(connection, user_id=ctx.author.id)
-            self._opted_in.remove(ctx.author.id)
+            self._opt_ins.remove(ctx.author.id)
+            self._presence.remove(ctx.author.id)
 
         await ctx.tick()
 
@@ -120,6 +241,7 @@ class Logging(Cog):
         async with ctx.db as connection:
             await OptInStatus.is_opted_in(connection, ctx)
             await OptInStatus.update_where(connection, "user_id = $1", ctx.author.id, public=public)
+            self._opt_ins.update(ctx.author.id, public=public)
 
         await ctx.tick()
 
@@ -129,11 +251,7 @@ class Logging(Cog):
         async with ctx.db as connection:
             await OptInStatus.is_opted_in(connection, ctx)
             await OptInStatus.update_where(connection, "user_id = $1", ctx.author.id, nsfw=nsfw)
-            if nsfw:
-                self._log_nsfw.add(ctx.author.id)
-            else:
-                with suppress(KeyError):
-                    self._log_nsfw.remove(ctx.author.id)
+            self._opt_ins.update(ctx.author.id, nsfw=nsfw)
 
         await ctx.tick()
 
@@ -142,28 +260,231 @@ class Logging(Cog):
         """Adds a bot to logging."""
         async with ctx.db as conn:
             await OptInStatus.insert(connection=conn, user_id=bot.id, public=True, nsfw=True)
-            self._opted_in.add(bot.id)
+            self._opt_ins.add(bot.id, public=True, nsfw=True)
 
         await ctx.tick()
 
+    @logging.command(name="flush_mode", hidden=True)
+    @commands.is_owner()
+    async def logging_flush_mode(self, ctx: Context, mode: Optional[str] = None):
+        """Set the flush mode used for the logging buffers.
+
+        `mode`: Either `insert` or `copy`, omit to show flush throughput for each mode.
+        """
+        if mode is None:
+            lines = [
+                f"{table:<32} {flush_mode:<6} {result.rows:>8} rows {result.rows_per_second:>12.1f} rows/s"
+                for (table, flush_mode), result in sorted(self._flush_results.items())
+            ]
+            results = "\n".join(lines) or "No flushes yet."
+            await ctx.send(f"Current flush mode: `{self._flush_mode}`\n```\n{results}\n```")
+            return
+
+        if mode not in FLUSH_MODES:
+            raise commands.BadArgument(f"Flush mode must be one of: {', '.join(FLUSH_MODES)}.")
+
+        self._flush_mode = mode  # type: ignore
+        await ctx.tick()
+
+    @logging.command(name="metrics", hidden=True)
+    @commands.is_owner()
+    async def logging_metrics(self, ctx: Context, prometheus: bool = False):
+        """Show logging pipeline metrics.
+
+        `prometheus`: Send the metrics in the Prometheus text format instead of a summary.
+        """
+        metrics = self._collect_metrics()
+
+        if prometheus:
+            await ctx.send(file=discord.File(io.BytesIO(metrics.prometheus().encode()), "metrics.prom"))
+            return
+
+        def quantiles(name: str, **labels: str) -> str:
+            histogram = metrics.histogram(name, **labels)
+            if histogram is None:
+                return f"{'-':>15}"
+            return f"{histogram.quantile(0.5):>7g}/{histogram.quantile(0.99):<7g}"
+
+        lines = [
+            f"{'buffer':<20} {'depth':>7} {'enqueued':>9} {'flushed':>9} "
+            f"{'skipped':>8} {'failed':>7} {'p50/p99 s':>15}"
+        ]
+        for name in self.bot._log_buffers.buffers:
+            lines.append(
+                f"{name:<20} {metrics.value('logging_buffer_rows', buffer=name):>7g} "
+                f"{metrics.value('logging_entries_enqueued_total', buffer=name):>9g} "
+                f"{metrics.value('logging_entries_flushed_total', buffer=name):>9g} "
+                f"{metrics.value('logging_entries_skipped_total', buffer=name):>8g} "
+                f"{metrics.value('logging_entries_failed_total', buffer=name):>7g} "
+                f"{quantiles('logging_buffer_flush_seconds', buffer=name)}"
+            )
+        lines.append("")
+        lines.append(f"{'flush duration':<20} {quantiles('logging_flush_duration_seconds')}")
+        lines.append(f"{'pool acquire wait':<20} {quantiles('logging_pool_acquire_seconds')}")
+
+        table = "\n".join(lines)
+        await ctx.send(f"```\n{table}\n```")
+
+    @logging.command(name="migrate_edit_history", hidden=True)
+    @commands.is_owner()
+    async def logging_migrate_edit_history(self, ctx: Context):
+        """Remove the edit history rows which were written for messages that were never edited."""
+        async with ctx.typing():
+            async with self._flush_lock:
+                async with ctx.db as connection:
+                    removed = await MessageEditHistory.remove_redundant_history(connection)
+
+        await ctx.send(f"Removed {removed} redundant edit history rows.")
+
+    @logging.command(name="rebuild_corpus", hidden=True)
+    @commands.is_owner()
+    async def logging_rebuild_corpus(self, ctx: Context):
+        """Rebuild the markov corpus from the message log."""
+        async with ctx.typing():
+            async with self._flush_lock:
+                async with ctx.db as connection:
+                    entries = await MarkovCorpus.rebuild(connection)
+
+        await ctx.send(f"Rebuilt the markov corpus with {entries} entries.")
+
+    @logging.command(name="rebuild_status_rollup", hidden=True)
+    @commands.is_owner()
+    async def logging_rebuild_status_rollup(self, ctx: Context):
+        """Recompute the daily status totals from the status log."""
+        async with ctx.typing():
+            async with ctx.db as connection:
+                users = await StatusRollup.rebuild(connection)
+
+        await ctx.send(f"Rebuilt the daily status totals of {users} users.")
+
+    @logging.command(name="partitions", hidden=True)
+    @commands.is_owner()
+    async def logging_partitions(self, ctx: Context):
+        """List the monthly partitions of the logging tables."""
+        lines = []
+        async with ctx.db as connection:
+            for name, spec in PARTITIONED_TABLES.items():
+                if not await is_partitioned(connection, spec):
+                    lines.append(f"{name}: not partitioned")
+                    continue
+                for partition in await get_partitions(connection, spec):
+                    lines.append(f"{name}: {partition.name:<40} ~{partition.rows} rows")
+
+        partitions = "\n".join(lines)
+        await ctx.send(f"```\n{partitions}\n```")
+
+    @logging.command(name="migrate_partitions", hidden=True)
+    @commands.is_owner()
+    async def logging_migrate_partitions(self, ctx: Context, table: Literal["status", "message"]):
+        """Convert a logging table to monthly partitions.
+
+        Flushing is paused while rows are copied, buffered entries are written once the migration completes.
+        Rows are copied a month at a time into the new table, so reads only see part of the log until it finishes
+        and status images aren't cached meanwhile. Running this again resumes an interrupted migration.
+        """
+        spec = PARTITIONED_TABLES[table]
+
+        async with ctx.typing():
+            async with self._flush_lock:
+                async with ctx.db as connection:
+                    if await is_partitioned(connection, spec) and not await is_migrating(connection, spec):
+                        raise commands.BadArgument(f"The {table} log is already partitioned.")
+                    await ctx.send(
+                        f"Migrating the {table} log, until the migration completes commands reading it will only "
+                        "see the months copied so far."
+                    )
+
+                    # Left set if the migration fails, as the new table is still missing rows
+                    self.bot._log_migrating.add(table)
+                    try:
+                        copied = await migrate_to_partitioned(connection, spec, ahead=CONFIG.PARTITION_MONTHS_AHEAD)
+                    except RuntimeError as e:
+                        raise commands.BadArgument(f"The {table} log migration could not be completed: {e}")
+                    self.bot._log_migrating.discard(table)
+
+        await ctx.send(f"Copied {copied} rows into the partitioned {table} log, its full history is available again.")
+
+    @logging.command(name="drop_partitions", hidden=True)
+    @commands.is_owner()
+    async def logging_drop_partitions(self, ctx: Context, table: Literal["status", "message"], months: int):
+        """Drop partitions of a logging table which are entirely older than n months.
+
+        Dropping message log partitions also removes the attachments and edit history of those messages.
+        """
+        if months < 1:
+            raise commands.BadArgument("You must keep at least one month of logs.")
+
+        spec = PARTITIONED_TABLES[table]
+        before = add_months(month_start(discord.utils.utcnow()), -months)
+
+        # Flushes are paused so no edit or attachment of a dropped message is written in between
+        async with self._flush_lock:
+            async with ctx.db as connection:
+                if not await is_partitioned(connection, spec):
+                    raise commands.BadArgument(f"The {table} log is not partitioned.")
+                dropped = await drop_partitions(connection, spec, before)
+                if table == "message" and dropped:
+                    await MarkovCorpus.delete_where(
+                        connection, "message_id < $1", discord.utils.time_snowflake(before)
+                    )
+
+        await ctx.send(f"Dropped {len(dropped)} partitions: {', '.join(dropped) or 'none'}.")
+
+    def _start_vacuum(self, days: int) -> asyncio.Task:
+        if self._vacuum_task is not None and not self._vacuum_task.done():
+            raise commands.BadArgument(f"A status log vacuum is already running. {self._vacuum}")
+
+        cutoff = datetime.datetime.combine(
+            discord.utils.utcnow().date() - datetime.timedelta(days=days), datetime.time(), datetime.timezone.utc
+        )
+        self._vacuum = VacuumProgress(cutoff)
+        self._vacuum_task = self.bot.loop.create_task(
+            vacuum_status_log(
+                self.bot.pool, self._vacuum, chunk_days=CONFIG.VACUUM_CHUNK_DAYS, pause=CONFIG.VACUUM_CHUNK_PAUSE
+            )
+        )
+        self._vacuum_task.add_done_callback(self._on_vacuum_done)
+        return self._vacuum_task
+
+    def _on_vacuum_done(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        exception = task.exception()
+        if exception is not None:
+            self.bot.log.error(f"Status log vacuum failed. {self._vacuum}", exc_info=exception)
+        else:
+            self.bot.log.info(str(task.result()))
+
     @commands.command(name="vacuum_status_log")
     @commands.is_owner()
-    async def vacuum_status_log(self, ctx: Context, days: int = 35):
-        """Remove entries from the status log older than n days."""
-        raise commands.BadArgument("This Command is not yet implemented.")
+    async def vacuum_status_log(self, ctx: Context, days: Optional[int] = None):
+        """Remove entries from the status log older than n days.
+
+        Entries are compacted into daily status totals before they are removed.
+        The vacuum runs in the background, omit `days` to show its progress.
+        """
+        if days is None:
+            await ctx.send(str(self._vacuum or "No status log vacuum has run yet."))
+            return
+
+        if days < MIN_RETENTION_DAYS:
+            raise commands.BadArgument(f"You must keep at least {MIN_RETENTION_DAYS} days of status logs.")
+
+        self._start_vacuum(days)
+        await ctx.tick()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.content is None:
             return
 
-        if message.author.id not in self._opted_in:
+        if message.author.id not in self._opt_ins:
             return
 
         if not isinstance(message.channel, discord.abc.GuildChannel):
             return
 
-        if message.channel.is_nsfw() and message.author.id not in self._log_nsfw:
+        if message.channel.is_nsfw() and not self._opt_ins.logs_nsfw(message.author.id):
             return
 
         for i, attachment in enumerate(message.attachments):
@@ -174,15 +495,10 @@ class Logging(Cog):
                 else:
                     charset = "utf-8"
 
-                try:
-                    content = await attachment.read()
-                    content = content.decode(charset)
-                except (LookupError, UnicodeDecodeError, discord.HTTPException):
-                    continue
+                self._attachments.submit(AttachmentJob(message.id, i, attachment.url, attachment.size, charset))
 
-                self.bot._message_attachment_log.append(MessageAttachmentLogEntry(message.id, i, content))
-
-        self.bot._message_log.append(
+        self.bot._log_buffers.append(
+            "message",
             MessageLogEntry(
                 message.channel.id,
                 message.id,
@@ -190,129 +506,255 @@ class Logging(Cog):
                 message.author.id,
                 message.content,
                 message.channel.is_nsfw(),  # type: ignore
-            )
+            ),
         )
-        self.bot._message_update_log.append(MessageUpdateLogEntry(message.id, discord.utils.utcnow(), message.content))
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
-        self.bot._message_delete_log.append(
+        self.bot._log_buffers.append(
+            "message_delete",
             MessageDeleteLogEntry(
                 payload.message_id,
-            )
+            ),
         )
 
     @commands.Cog.listener()
     async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
         if payload.data.get("content"):
-            self.bot._message_update_log.append(
-                MessageUpdateLogEntry(payload.message_id, discord.utils.utcnow(), payload.data["content"])
+            self.bot._log_buffers.append(
+                "message_update",
+                MessageUpdateLogEntry(payload.message_id, discord.utils.utcnow(), payload.data["content"]),
             )
 
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
-        if before.status == after.status:
-            changed = {a.type for a in before.activities} ^ {a.type for a in after.activities}
-            if discord.ActivityType.streaming not in changed:
+        # This fires for every member of every guild, almost none of whom have opted in
+        if after.id not in self._opted_in:
+            return
+
+        if before.status != after.status:
+            # The same change arrives once for every guild the user shares with the bot
+            if self._presence.is_repeat(after.id, after.status):
                 return
+        elif is_streaming(before) == is_streaming(after):
+            return
+
+        status = member_status(after)
+        if status is None:
+            return
 
-        if before.id not in self._opted_in:
+        if self._presence.update(after.id, status, after.status):
+            entry = StatusLogEntry(after.id, discord.utils.utcnow(), status)  # type: ignore
+            self.bot._log_buffers.append("status", entry)
+
+    def _collect_metrics(self) -> Metrics:
+        """Update the metrics which are tracked elsewhere."""
+        metrics = self.bot._log_metrics
+        buffers = self.bot._log_buffers
+
+        for name, buffer in buffers.buffers.items():
+            metrics.set("logging_buffer_rows", len(buffer), buffer=name)
+            metrics.set("logging_buffer_bytes", buffer.bytes, buffer=name)
+            metrics.set_total("logging_entries_enqueued_total", buffers.enqueued[name], buffer=name)
+            metrics.set_total("logging_entries_dropped_total", buffers.dropped[name], buffer=name)
+            metrics.set_total("logging_entries_spilled_total", buffers.spilled[name], buffer=name)
+
+        metrics.set("logging_event_rate", buffers.rate)
+        metrics.set("logging_flush_interval_seconds", buffers.interval)
+        metrics.set("logging_attachment_queue_depth", self._attachments.queue.qsize())
+        for reason, count in self._attachments.skipped.items():
+            metrics.set_total("logging_attachments_skipped_total", count, reason=reason)
+
+        if self._vacuum is not None:
+            metrics.set("logging_status_vacuum_rows", self._vacuum.rows)
+
+        presence = self._presence
+        metrics.set("logging_presence_tracked_users", len(presence))
+        metrics.set_total("logging_presence_changes_total", presence.changes)
+        metrics.set_total("logging_presence_coalesced_total", presence.coalesced)
+        metrics.set_total("logging_presence_unchanged_total", presence.unchanged)
+        metrics.set_total("logging_presence_evicted_total", presence.evicted)
+
+        return metrics
+
+    def _write_metrics(self) -> None:
+        path = CONFIG.METRICS_PATH
+        if path is None:
             return
 
-        # Handle streaming edge case
-        if discord.ActivityType.streaming in {a.type for a in after.activities}:
-            status = Status.streaming
+        # Written then renamed so a scraper never reads a partial file
+        with open(f"{path}.tmp", "w") as fp:
+            fp.write(self._collect_metrics().prometheus())
+        os.replace(f"{path}.tmp", path)
+
+    async def _flush(
+        self, connection: asyncpg.Connection, table: type[Table], records: list, *, parent: Optional[Parent] = None
+    ) -> int:
+        result = await flush_records(connection, table, records, mode=self._flush_mode, parent=parent)
+        self._flush_results[result.table, result.mode] = result
+        self.bot.log.debug(
+            f"Flushed {result.rows} rows to {result.table} via {result.mode} ({result.rows_per_second:.1f} rows/s)"
+        )
+        return result.written
+
+    async def _flush_buffer(self, connection: asyncpg.Connection, name: str, entries: ColumnarBatch) -> int:
+        """Write the entries of a single buffer, returning the number of rows written.
+
+        The markov corpus is updated after the log tables, both steps are idempotent so a retried flush is safe.
+        """
+        message_ids = entries.column("message_id") if name != "status" else ()
+
+        if name == "message_delete":
+            written = await apply_deletes(connection, MessageLog, message_ids)
+            await MarkovCorpus.remove_messages(connection, message_ids)
+        elif name == "message_update":
+            written = await apply_edits(connection, MessageLog, MessageEditHistory, entries)
+            await MarkovCorpus.refresh_messages(connection, message_ids)
         else:
-            status = Status.try_value(after.status.name)
+            written = await self._flush(connection, FLUSH_TABLES[name], entries, parent=FLUSH_PARENTS.get(name))
+            if name == "status":
+                since = min(entries.column("timestamp"))
+                await StatusRollup.refresh_users(connection, entries.column("user_id"), since)
+            elif name == "message":
+                await MarkovCorpus.refresh_messages(connection, message_ids)
+            elif name == "message_attachment":
+                await MarkovCorpus.add_attachments(connection, message_ids)
+
+        return written
+
+    async def _flush_batch(self, connection: asyncpg.Connection, batch: Batch) -> None:
+        metrics = self.bot._log_metrics
+
+        # Entries are removed from the batch once written so a failed flush only retries what is left
+        for name in self.bot._log_buffers.buffers:
+            if name not in batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                written = await self._flush_buffer(connection, name, batch[name])
+            except Exception:
+                for remaining, entries in batch.items():
+                    metrics.inc("logging_entries_failed_total", len(entries), buffer=remaining)
+                raise
+
+            rows = len(batch.pop(name))
+            metrics.observe("logging_buffer_flush_seconds", time.perf_counter() - start, buffer=name)
+            metrics.inc("logging_entries_flushed_total", written, buffer=name)
+            # Rows rejected by conflicts, or edits, deletes and attachments of messages which were never logged
+            metrics.inc("logging_entries_skipped_total", rows - written, buffer=name)
+
+    @tasks.loop(seconds=0)
+    async def _logging_task(self):
+        await self.bot._log_buffers.wait()
+        metrics = self.bot._log_metrics
+
+        start = time.perf_counter()
+        async with self._flush_lock, MaybeAcquire(pool=self.bot.pool) as connection:
+            metrics.observe("logging_pool_acquire_seconds", time.perf_counter() - start)
+
+            with closing(self.bot._log_buffers.drain()) as batches:
+                for batch in batches:
+                    await self._flush_batch(connection, batch)
+
+        metrics.observe("logging_flush_duration_seconds", time.perf_counter() - start)
+        self._write_metrics()
 
-        if status not in COLOURS:
+    @tasks.loop(hours=24)
+    async def _partition_task(self):
+        async with MaybeAcquire(pool=self.bot.pool) as connection:
+            for spec in PARTITIONED_TABLES.values():
+                if await is_partitioned(connection, spec):
+                    await ensure_partitions(connection, spec, ahead=CONFIG.PARTITION_MONTHS_AHEAD)
+
+    @tasks.loop(hours=24)
+    async def _vacuum_schedule(self):
+        if CONFIG.STATUS_RETENTION_DAYS is None:
             return
 
-        if status == self.bot._last_status.get(after.id):
+        # The vacuum runs in the background and logs its progress when done, a run still going is left alone
+        if self._vacuum_task is not None and not self._vacuum_task.done():
+            self.bot.log.info(f"Skipping the scheduled status log vacuum, one is still running. {self._vacuum}")
             return
 
-        self.bot._status_log.append(StatusLogEntry(after.id, discord.utils.utcnow(), status))  # type: ignore
-        self.bot._last_status[after.id] = status  # type: ignore
+        self._start_vacuum(CONFIG.STATUS_RETENTION_DAYS)
 
-    @tasks.loop(seconds=60)
-    async def _logging_task(self):
-        async with MaybeAcquire(pool=self.bot.pool) as connection:
-            if self.bot._status_log:
-                await StatusLog.insert_many(connection, StatusLog._columns, *self.bot._status_log)
-                self.bot._status_log = []
-
-            if self.bot._message_log:
-                await MessageLog.insert_many(connection, MessageLog._columns, *self.bot._message_log)
-                self.bot._message_log = []
-
-            if self.bot._message_delete_log:
-                await connection.executemany(
-                    f"UPDATE {MessageLog._name} SET deleted = TRUE WHERE message_id = $1",
-                    self.bot._message_delete_log,
-                )
-                self.bot._message_delete_log = []
-
-            if self.bot._message_attachment_log:
-                await MessageAttachments.insert_many(
-                    connection,
-                    MessageAttachments._columns,
-                    *self.bot._message_attachment_log,
-                )
-                self.bot._message_attachment_log = []
-
-            if self.bot._message_update_log:
-                await connection.executemany(
-                    f"UPDATE {MessageLog._name} SET content = $2 WHERE message_id = $1",
-                    ((entry[0], entry[2]) for entry in self.bot._message_update_log),
-                )
-                for entry in self.bot._message_update_log:
-                    with suppress(asyncpg.exceptions.IntegrityConstraintViolationError):
-                        await MessageEditHistory.insert_many(connection, MessageEditHistory._columns, entry)
-                self.bot._message_update_log = []
+    @_vacuum_schedule.before_loop
+    async def _before_vacuum_schedule(self):
+        await self.bot.wait_until_ready()
+
+    @_partition_task.before_loop
+    async def _before_partition_task(self):
+        await self.bot.wait_until_ready()
 
     @_logging_task.before_loop
     async def _before_logging_task(self):
+        replayed = self.bot._log_buffers.replay()
+        if replayed:
+            self.bot.log.info(f"Replayed {replayed} unflushed log entries from the spool.")
+
         await self.bot.wait_until_ready()
 
         async with MaybeAcquire(pool=self.bot.pool) as connection:
+            await MarkovCorpus.create_indexes(connection)
 
-            for record in await OptInStatus.fetch(connection):
-                self._opted_in.add(record["user_id"])
-                if record["nsfw"]:
-                    self._log_nsfw.add(record["user_id"])
-
-            # Fill with current status data
-            status_log = []
-            now = discord.utils.utcnow()
+            self._opt_ins.load(await OptInStatus.fetch(connection))
 
-            for user_id in self._opted_in:
-                for guild in self.bot.guilds:
-                    member = guild.get_member(user_id)
-                    if member is not None:
+            for name, spec in PARTITIONED_TABLES.items():
+                if await is_migrating(connection, spec):
+                    self.bot._log_migrating.add(name)
 
-                        # Handle streaming edge case
-                        if discord.ActivityType.streaming in {a.type for a in member.activities}:
-                            status = Status.streaming
-                        else:
-                            status = Status.try_value(member.status.name)
+            # Fill with current status data, a user's presence is the same in every guild
+            current: dict[int, tuple[Status, discord.Status]] = {}
+            for guild in self.bot.guilds:
+                for member in guild.members:
+                    if member.id in current or member.id not in self._opt_ins:
+                        continue
+                    status = member_status(member)
+                    if status is not None:
+                        current[member.id] = (status, member.status)
 
-                        if status not in COLOURS:
-                            return
+            last_status = await StatusLog.get_last_statuses(connection, current)
 
-                        status_log.append(StatusLogEntry(user_id, now, status))  # type: ignore
-                        self.bot._last_status[member.id] = status  # type: ignore
-                        break
+        # Entries replayed from the spool are newer than anything stored
+        for user_id, _, status in self.bot._log_buffers["status"]:
+            last_status[user_id] = status
 
-            await StatusLog.insert_many(connection, StatusLog._columns, *status_log)
+        # Only log users whose status changed while the bot was offline
+        now = discord.utils.utcnow()
+        for user_id, (status, raw) in current.items():
+            if last_status.get(user_id) != status:
+                self.bot._log_buffers.append("status", StatusLogEntry(user_id, now, status))  # type: ignore
+            self._presence.update(user_id, status, raw)
 
 
 def setup(bot: LoggingBot):
     if not hasattr(bot, "_logging"):
         bot._logging = True
-        bot._message_log = []
-        bot._message_delete_log = []
-        bot._message_attachment_log = []
-        bot._message_update_log = []
-        bot._status_log = []
-        bot._last_status = {}
+        bot._log_buffers = BufferManager(
+            FlushPolicy(
+                max_rows=CONFIG.FLUSH_MAX_ROWS,
+                max_bytes=CONFIG.FLUSH_MAX_BYTES,
+                max_age=CONFIG.FLUSH_MAX_AGE,
+                min_interval=CONFIG.FLUSH_MIN_INTERVAL,
+                batch_rows=CONFIG.FLUSH_BATCH_ROWS,
+                max_total_bytes=CONFIG.BUFFER_MAX_BYTES,
+                overflow=CONFIG.BUFFER_OVERFLOW,
+                spill_path=CONFIG.BUFFER_SPILL_PATH,
+            ),
+            ("status", StatusLogEntry),
+            ("message", MessageLogEntry),
+            ("message_delete", MessageDeleteLogEntry),
+            ("message_attachment", MessageAttachmentLogEntry),
+            ("message_update", MessageUpdateLogEntry),
+            spool=Spool(CONFIG.SPOOL_PATH),
+        )
+        bot._log_metrics = Metrics()
+        bot._log_opt_ins = OptInCache()
+        bot._log_migrating = set()
+        for name, kind, description in METRICS:
+            bot._log_metrics.describe(name, kind, description)
+        bot._log_presence = PresenceTracker(
+            window=CONFIG.PRESENCE_COALESCE_WINDOW, max_users=CONFIG.PRESENCE_MAX_USERS
+        )
     bot.add_cog(Logging(bot))
@@ -1,3 +1,8 @@
+import datetime
+
+from collections.abc import Iterable
+from typing import Any, Optional
+
 import asyncpg
 import discord
 
@@ -7,6 +12,16 @@ from donphan import Column, Enum, SQLType, Table
 from ditto import Context
 from donphan.types import EnumType
 
+from .optin import OptIn, OptInCache
+
+
+DISCORD_EPOCH = 1420070400000
+
+
+def snowflake_time(column: str) -> str:
+    """SQL for the UTC creation time of a snowflake, as a timestamp without time zone."""
+    return f"to_timestamp((({column} >> 22) + {DISCORD_EPOCH}) / 1000.0) AT TIME ZONE 'UTC'"
+
 
 class MessageLog(Table, schema="logging"):
     channel_id: Column[SQLType.BigInt] = Column(primary_key=True)
@@ -25,13 +40,7 @@ class MessageLog(Table, schema="logging"):
         nsfw: bool = False,
         flatten_case: bool = False,
     ) -> list[str]:
-        query = f"""
-            SELECT * FROM (SELECT message_id, content, user_id, deleted, nsfw from {MessageLog._name}
-            UNION SELECT b.message_id, b.content, a.user_id, a.deleted, a.nsfw from {MessageAttachments._name}  AS b
-            INNER JOIN {MessageLog._name} AS a ON (a.message_id = b.message_id)
-            ) _ WHERE deleted = false AND user_id = $1 AND nsfw <= $2 AND content LIKE '% %';
-        """
-        data = await connection.fetch(query, user.id, nsfw)
+        data = await connection.fetch(_corpus_query("user_id", nsfw), user.id)
         return [record["content"].lower() if flatten_case else record["content"] for record in data]
 
     @classmethod
@@ -42,16 +51,18 @@ class MessageLog(Table, schema="logging"):
         nsfw: bool = False,
         flatten_case: bool = False,
     ) -> list[str]:
-        query = f"""
-            SELECT * FROM (SELECT message_id, content, guild_id, deleted, nsfw from {MessageLog._name}
-            UNION SELECT b.message_id, b.content, a.guild_id, a.deleted, a.nsfw from {MessageAttachments._name} AS b
-            INNER JOIN {MessageLog._name} AS a ON (a.message_id = b.message_id)
-            ) _ WHERE deleted = false AND guild_id = $1 AND nsfw <= $2 AND content LIKE '% %';
-        """
-        data = await connection.fetch(query, guild.id, nsfw)
+        data = await connection.fetch(_corpus_query("guild_id", nsfw), guild.id)
         return [record["content"].lower() if flatten_case else record["content"] for record in data]
 
 
+def _corpus_query(column: str, nsfw: bool) -> str:
+    # Separate queries rather than a parameter so the partial index is used for SFW channels
+    query = f"SELECT content FROM {MarkovCorpus._name} WHERE {column} = $1"
+    if not nsfw:
+        query += " AND NOT nsfw"
+    return query
+
+
 class MessageAttachments(Table, schema="logging"):
     message_id: Column[SQLType.BigInt] = Column(primary_key=True, references=MessageLog.message_id)
     attachment_id: Column[SQLType.BigInt]
@@ -63,6 +74,129 @@ class MessageEditHistory(Table, schema="logging"):
     created_at: Column[SQLType.Timestamp] = Column(primary_key=True)
     content: Column[str]
 
+    @classmethod
+    async def get_history(cls, connection: asyncpg.Connection, message_id: int) -> list[asyncpg.Record]:
+        """Fetch every version of a message, starting with its original content."""
+        query = f"""
+            SELECT created_at, content FROM {cls._name} WHERE message_id = $1
+            UNION ALL
+            SELECT {snowflake_time("message_id")} AS created_at, content FROM {MessageLog._name}
+            WHERE message_id = $1 AND NOT EXISTS (SELECT 1 FROM {cls._name} WHERE message_id = $1)
+            ORDER BY created_at;
+        """
+        return await connection.fetch(query, message_id)
+
+    @classmethod
+    async def remove_redundant_history(cls, connection: asyncpg.Connection) -> int:
+        """Remove the edit history rows which used to be written for every new message.
+
+        A message which was never edited has a single history row holding its content. Edited messages
+        always have at least two, their original and an edit, so running this again removes nothing.
+        Returns the number of history rows removed.
+        """
+        query = f"""
+            WITH unedited AS (
+                SELECT message_id FROM {cls._name} GROUP BY message_id HAVING count(*) = 1
+            )
+            DELETE FROM {cls._name} AS h USING unedited AS u, {MessageLog._name} AS m
+            WHERE h.message_id = u.message_id AND m.message_id = h.message_id AND h.content = m.content;
+        """
+        status = await connection.execute(query)
+        return int(status.rsplit(" ", 1)[1])
+
+
+# Only messages with more than one word are useful to train markov chains on
+MARKOV_ELIGIBLE = "LIKE '% %'"
+
+
+class MarkovCorpus(Table, schema="logging"):
+    """The current content of logged messages and attachments which markov chains are trained on.
+
+    Kept up to date by the logging flush so reading a corpus is a single index scan.
+    """
+
+    message_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    attachment: Column[bool] = Column(primary_key=True)
+    user_id: Column[SQLType.BigInt]
+    guild_id: Column[SQLType.BigInt]
+    nsfw: Column[bool]
+    content: Column[str]
+
+    @classmethod
+    async def create_indexes(cls, connection: asyncpg.Connection) -> None:
+        local_name = cls._name.rsplit(".", 1)[-1]
+        for column in ("user_id", "guild_id"):
+            await connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {local_name}_{column}_idx ON {cls._name} ({column});"
+            )
+            await connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {local_name}_{column}_sfw_idx ON {cls._name} ({column}) WHERE NOT nsfw;"
+            )
+
+    @classmethod
+    async def refresh_messages(cls, connection: asyncpg.Connection, message_ids: Iterable[int]) -> None:
+        """Add or update the content of messages, removing any which are no longer eligible."""
+        message_ids = list(set(message_ids))
+        await connection.execute(
+            f"""
+            INSERT INTO {cls._name} (message_id, attachment, user_id, guild_id, nsfw, content)
+            SELECT m.message_id, FALSE, m.user_id, m.guild_id, m.nsfw, m.content
+            FROM {MessageLog._name} AS m
+            WHERE m.message_id = ANY($1::bigint[]) AND NOT m.deleted AND m.content {MARKOV_ELIGIBLE}
+            ON CONFLICT (message_id, attachment) DO UPDATE SET content = EXCLUDED.content;
+            """,
+            message_ids,
+        )
+        await connection.execute(
+            f"""
+            DELETE FROM {cls._name} AS c USING {MessageLog._name} AS m
+            WHERE c.message_id = m.message_id AND NOT c.attachment AND c.message_id = ANY($1::bigint[])
+                AND NOT m.content {MARKOV_ELIGIBLE};
+            """,
+            message_ids,
+        )
+
+    @classmethod
+    async def add_attachments(cls, connection: asyncpg.Connection, message_ids: Iterable[int]) -> None:
+        await connection.execute(
+            f"""
+            INSERT INTO {cls._name} (message_id, attachment, user_id, guild_id, nsfw, content)
+            SELECT b.message_id, TRUE, m.user_id, m.guild_id, m.nsfw, b.content
+            FROM {MessageAttachments._name} AS b
+            INNER JOIN {MessageLog._name} AS m ON (m.message_id = b.message_id)
+            WHERE b.message_id = ANY($1::bigint[]) AND NOT m.deleted AND b.content {MARKOV_ELIGIBLE}
+            ON CONFLICT DO NOTHING;
+            """,
+            list(set(message_ids)),
+        )
+
+    @classmethod
+    async def remove_messages(cls, connection: asyncpg.Connection, message_ids: Iterable[int]) -> None:
+        await connection.execute(
+            f"DELETE FROM {cls._name} WHERE message_id = ANY($1::bigint[]);",
+            list(set(message_ids)),
+        )
+
+    @classmethod
+    async def rebuild(cls, connection: asyncpg.Connection) -> int:
+        """Rebuild the corpus from the message log, returns the number of entries."""
+        async with connection.transaction():
+            await connection.execute(f"TRUNCATE {cls._name};")
+            await connection.execute(
+                f"""
+                INSERT INTO {cls._name} (message_id, attachment, user_id, guild_id, nsfw, content)
+                SELECT m.message_id, FALSE, m.user_id, m.guild_id, m.nsfw, m.content
+                FROM {MessageLog._name} AS m
+                WHERE NOT m.deleted AND m.content {MARKOV_ELIGIBLE}
+                UNION ALL
+                SELECT b.message_id, TRUE, m.user_id, m.guild_id, m.nsfw, b.content
+                FROM {MessageAttachments._name} AS b
+                INNER JOIN {MessageLog._name} AS m ON (m.message_id = b.message_id)
+                WHERE NOT m.deleted AND b.content {MARKOV_ELIGIBLE};
+                """
+            )
+            return await connection.fetchval(f"SELECT count(*) FROM {cls._name};")
+
 
 class Status(Enum):
     online = "online"
@@ -81,36 +215,200 @@ class StatusLog(Table, schema="logging"):
     timestamp: Column[SQLType.Timestamp] = Column(primary_key=True)
     status: Column[_Status]
 
+    @classmethod
+    async def get_latest(cls, connection: asyncpg.Connection, user_id: int) -> Optional[datetime.datetime]:
+        """The time of a user's most recent transition, read from the primary key index."""
+        return await connection.fetchval(f'SELECT max("timestamp") FROM {cls._name} WHERE user_id = $1;', user_id)
+
+    @classmethod
+    async def get_last_statuses(cls, connection: asyncpg.Connection, user_ids: Iterable[int]) -> dict[int, Status]:
+        """The most recently logged status of each user, one primary key index lookup per user."""
+        records = await connection.fetch(
+            f"""
+            SELECT u.user_id, s.status FROM unnest($1::bigint[]) AS u(user_id)
+            CROSS JOIN LATERAL (
+                SELECT status FROM {cls._name}
+                WHERE user_id = u.user_id
+                ORDER BY "timestamp" DESC LIMIT 1
+            ) AS s;
+            """,
+            list(user_ids),
+        )
+        return {record["user_id"]: record["status"] for record in records}
+
+
+class StatusRollup(Table, schema="logging"):
+    """Seconds spent in each status per user and UTC day.
+
+    Days are recomputed from the status log rather than added to, so updating a day twice is harmless.
+    Only closed intervals are counted, the user's current status is added once it changes.
+    """
+
+    user_id: Column[SQLType.BigInt] = Column(primary_key=True)
+    day: Column[SQLType.Date] = Column(primary_key=True)
+    status: Column[_Status] = Column(primary_key=True)
+    seconds: Column[SQLType.Integer]
+
+    @classmethod
+    async def _recompute(cls, connection: asyncpg.Connection, days: str, *args: Any) -> None:
+        # Each day's intervals are its own transitions, bounded by the transitions either side of the day
+        await connection.execute(
+            f"""
+            WITH days AS ({days}), totals AS (
+                SELECT d.user_id, d.day, t.status, round(sum(EXTRACT(EPOCH FROM
+                    LEAST(t.finish, d.day + INTERVAL '1 day') - GREATEST(t.start, d.day)
+                )))::integer AS seconds
+                FROM days AS d
+                CROSS JOIN LATERAL (
+                    SELECT s.status, s."timestamp" AS start,
+                        lead(s."timestamp") OVER (ORDER BY s."timestamp") AS finish
+                    FROM (
+                        (SELECT status, "timestamp" FROM {StatusLog._name}
+                        WHERE user_id = d.user_id AND "timestamp" < d.day ORDER BY "timestamp" DESC LIMIT 1)
+                        UNION ALL
+                        (SELECT status, "timestamp" FROM {StatusLog._name}
+                        WHERE user_id = d.user_id AND "timestamp" >= d.day AND "timestamp" < d.day + INTERVAL '1 day')
+                        UNION ALL
+                        (SELECT status, "timestamp" FROM {StatusLog._name}
+                        WHERE user_id = d.user_id AND "timestamp" >= d.day + INTERVAL '1 day'
+                        ORDER BY "timestamp" LIMIT 1)
+                    ) AS s
+                ) AS t
+                WHERE t.finish IS NOT NULL AND t.start < d.day + INTERVAL '1 day'
+                GROUP BY d.user_id, d.day, t.status
+            ), removed AS (
+                DELETE FROM {cls._name} AS r USING days AS d
+                WHERE r.user_id = d.user_id AND r.day = d.day AND NOT EXISTS (
+                    SELECT 1 FROM totals AS t WHERE t.user_id = r.user_id AND t.day = r.day AND t.status = r.status
+                )
+            )
+            INSERT INTO {cls._name} AS r (user_id, day, status, seconds)
+            SELECT user_id, day, status, seconds FROM totals
+            ON CONFLICT (user_id, day, status) DO UPDATE SET seconds = EXCLUDED.seconds;
+            """,
+            *args,
+        )
+
+    @classmethod
+    async def refresh_users(
+        cls, connection: asyncpg.Connection, user_ids: Iterable[int], since: datetime.datetime
+    ) -> None:
+        """Recompute the days affected by transitions logged since a given time.
+
+        This starts from each user's last transition before that time, which the new transitions close.
+        """
+        await cls._recompute(
+            connection,
+            f"""
+            SELECT u.user_id, d.day::date AS day FROM unnest($1::bigint[]) AS u(user_id)
+            CROSS JOIN LATERAL (
+                SELECT COALESCE(
+                    (SELECT max("timestamp") FROM {StatusLog._name} WHERE user_id = u.user_id AND "timestamp" < $2),
+                    (SELECT min("timestamp") FROM {StatusLog._name} WHERE user_id = u.user_id)
+                ) AS start, (SELECT max("timestamp") FROM {StatusLog._name} WHERE user_id = u.user_id) AS finish
+            ) AS b
+            CROSS JOIN generate_series(
+                date_trunc('day', b.start), date_trunc('day', b.finish), INTERVAL '1 day'
+            ) AS d(day)
+            """,
+            list(set(user_ids)),
+            since,
+        )
+
+    @classmethod
+    async def refresh_days(
+        cls, connection: asyncpg.Connection, user_id: int, start: datetime.date, end: datetime.date
+    ) -> None:
+        """Recompute a user's days from start up to but not including end."""
+        await cls._recompute(
+            connection,
+            """
+            SELECT $1::bigint AS user_id, d.day::date AS day
+            FROM generate_series($2::date, $3::date - 1, INTERVAL '1 day') AS d(day)
+            """,
+            user_id,
+            start,
+            end,
+        )
+
+    @classmethod
+    async def rebuild(cls, connection: asyncpg.Connection, *, chunk_size: int = 100) -> int:
+        """Recompute every day of every user's status log, returns the number of users."""
+        records = await connection.fetch(f"SELECT DISTINCT user_id FROM {StatusLog._name};")
+        user_ids = [record["user_id"] for record in records]
+        for i in range(0, len(user_ids), chunk_size):
+            await cls.refresh_users(
+                connection, user_ids[i : i + chunk_size], datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+            )
+        return len(user_ids)
+
+    @classmethod
+    async def get_totals(
+        cls, connection: asyncpg.Connection, user_id: int, since: datetime.date
+    ) -> list[asyncpg.Record]:
+        return await connection.fetch(
+            f"""
+            SELECT status, sum(seconds) AS seconds FROM {cls._name}
+            WHERE user_id = $1 AND day >= $2
+            GROUP BY status;
+            """,
+            user_id,
+            since,
+        )
+
 
 class OptInStatus(Table, schema="logging"):
     user_id: Column[SQLType.BigInt] = Column(primary_key=True, index=True)
     public: Column[bool] = Column(default=False)
     nsfw: Column[bool] = Column(default=False)
 
+    @classmethod
+    async def get_opt_ins(
+        cls, connection: asyncpg.Connection, ctx: Context, user_ids: Iterable[int]
+    ) -> dict[int, Optional[OptIn]]:
+        """Fetch the logging preferences of users, from the logging cog's cache once it has loaded."""
+        cache: Optional[OptInCache] = getattr(ctx.bot, "_log_opt_ins", None)
+        if cache is not None and cache.loaded:
+            return cache.get_many(user_ids)
+
+        user_ids = list(user_ids)
+        records = await cls.fetch_where(connection, "user_id = ANY($1::bigint[])", user_ids)
+        opt_ins = {record["user_id"]: OptIn(record["public"], record["nsfw"]) for record in records}
+        return {user_id: opt_ins.get(user_id) for user_id in user_ids}
+
     @classmethod
     async def is_opted_in(cls, connection: asyncpg.Connection, ctx: Context):
-        opt_in_status = await cls.fetch_row(connection, user_id=ctx.author.id)
-        if opt_in_status is None:
+        opt_ins = await cls.get_opt_ins(connection, ctx, (ctx.author.id,))
+        if opt_ins[ctx.author.id] is None:
             raise commands.BadArgument(
                 f"You have not opted in to logging. You can do so with `{ctx.bot.prefix}logging start`"
             )
 
     @classmethod
     async def is_not_opted_in(cls, connection: asyncpg.Connection, ctx: Context):
-        opt_in_status = await cls.fetch_row(connection, user_id=ctx.author.id)
-        if opt_in_status is not None:
+        opt_ins = await cls.get_opt_ins(connection, ctx, (ctx.author.id,))
+        if opt_ins[ctx.author.id] is not None:
             raise commands.BadArgument("You have already opted into logging.")
 
     @classmethod
     async def is_public(cls, connection: asyncpg.Connection, ctx: Context, user: discord.User):
-        opt_in_status = await cls.fetch_row(connection, user_id=user.id)
-        if opt_in_status is None:
-            if user == ctx.author:
-                raise commands.BadArgument(
-                    f"You have not opted in to logging. You can do so with `{ctx.bot.prefix}logging start`"
-                )
-            else:
-                raise commands.BadArgument(f'User "{user}" has not opted in to logging.')
+        await cls.are_public(connection, ctx, (user,))
+
+    @classmethod
+    async def are_public(cls, connection: asyncpg.Connection, ctx: Context, users: Iterable[discord.User]):
+        """Check several users have opted in and made their logs public with a single lookup."""
+        users = list(users)
+        opt_ins = await cls.get_opt_ins(connection, ctx, (user.id for user in users))
+
+        for user in users:
+            opt_in_status = opt_ins[user.id]
+            if opt_in_status is None:
+                if user == ctx.author:
+                    raise commands.BadArgument(
+                        f"You have not opted in to logging. You can do so with `{ctx.bot.prefix}logging start`"
+                    )
+                else:
+                    raise commands.BadArgument(f'User "{user}" has not opted in to logging.')
 
-        if user != ctx.author and not opt_in_status["public"]:
-            raise commands.BadArgument(f'User "{user}" has not made their logs public.')
+            if user != ctx.author and not opt_in_status.public:
+                raise commands.BadArgument(f'User "{user}" has not made their logs public.')
@@ -0,0 +1,205 @@
+import time
+
+from array import array
+from collections.abc import Iterable, Sequence
+from typing import Any, Literal, NamedTuple, Optional
+
+import asyncpg
+from donphan import Table
+from donphan.types import EnumType
+
+from .columnar import ColumnarBatch
+from .db import snowflake_time
+
+
+FlushMode = Literal["insert", "copy"]
+FLUSH_MODES: tuple[FlushMode, ...] = ("insert", "copy")
+
+# A table and column each record must reference an existing row of
+Parent = tuple[type[Table], str]
+
+
+class FlushResult(NamedTuple):
+    table: str
+    mode: FlushMode
+    rows: int
+    written: int
+    duration: float
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.duration <= 0:
+            return float(self.rows)
+        return self.rows / self.duration
+
+
+def _is_enum(column: Any) -> bool:
+    return isinstance(column.sql_type, type) and issubclass(column.sql_type, EnumType)
+
+
+def _sql_type(column: Any) -> str:
+    # Enum codecs are text only, so enums are sent as text and cast in SQL
+    return "TEXT" if _is_enum(column) else column.sql_type.sql_type
+
+
+def _select(column: Any, source: str) -> str:
+    if _is_enum(column):
+        return f"{source}::{column.sql_type._name}"
+    return source
+
+
+def _row_count(status: str) -> int:
+    return int(status.rsplit(" ", 1)[1])
+
+
+def _where_parent(parent: Optional[Parent]) -> str:
+    # Conflicts are skipped but foreign key violations aren't, so records without a parent are filtered out
+    if parent is None:
+        return ""
+    table, column = parent
+    return f'WHERE EXISTS (SELECT 1 FROM {table._name} AS p WHERE p."{column}" = r."{column}")'
+
+
+async def insert_records(
+    connection: asyncpg.Connection, table: type[Table], records: ColumnarBatch, *, parent: Optional[Parent] = None
+) -> int:
+    columns = list(table._columns)
+    targets = ", ".join(f'"{column.name}"' for column in columns)
+    arrays = ", ".join(f"${i}::{_sql_type(column)}[]" for i, column in enumerate(columns, 1))
+    selects = ", ".join(_select(column, f'r."{column.name}"') for column in columns)
+
+    status = await connection.execute(
+        f"""
+        INSERT INTO {table._name} ({targets})
+        SELECT {selects} FROM unnest({arrays}) AS r({targets})
+        {_where_parent(parent)}
+        ON CONFLICT DO NOTHING
+        """,
+        *(values if isinstance(values, array) else list(values) for values in records.sql_columns()),
+    )
+    return _row_count(status)
+
+
+async def copy_records(
+    connection: asyncpg.Connection, table: type[Table], records: ColumnarBatch, *, parent: Optional[Parent] = None
+) -> int:
+    columns = list(table._columns)
+    names = [column.name for column in columns]
+    staging = f"_{table._local_name}_staging"
+
+    targets = ", ".join(f'"{name}"' for name in names)
+    selects = ", ".join(_select(column, f'r."{column.name}"') for column in columns)
+
+    async with connection.transaction():
+        await connection.execute(
+            f"CREATE TEMPORARY TABLE {staging} (LIKE {table._name} INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        for column in columns:
+            if _is_enum(column):
+                await connection.execute(f'ALTER TABLE {staging} ALTER COLUMN "{column.name}" TYPE TEXT')
+
+        await connection.copy_records_to_table(staging, records=records.sql_rows(), columns=names)
+        status = await connection.execute(
+            f"""
+            INSERT INTO {table._name} ({targets})
+            SELECT {selects} FROM {staging} AS r
+            {_where_parent(parent)}
+            ON CONFLICT DO NOTHING
+            """
+        )
+    return _row_count(status)
+
+
+async def flush_records(
+    connection: asyncpg.Connection,
+    table: type[Table],
+    records: ColumnarBatch,
+    *,
+    mode: FlushMode = "insert",
+    parent: Optional[Parent] = None,
+) -> FlushResult:
+    """Write a batch of records to a table using the given flush mode.
+
+    `insert` sends each column as an array and inserts them with a single
+    `unnest`, while `copy` streams the rows into a temporary staging table
+    with a binary COPY and merges them in a single statement. Both read the
+    columnar batch directly and skip records which already exist, so
+    replaying a batch is harmless. If a parent is given records referencing
+    a row which doesn't exist are skipped too.
+    """
+    start = time.perf_counter()
+
+    if mode == "copy":
+        written = await copy_records(connection, table, records, parent=parent)
+    else:
+        written = await insert_records(connection, table, records, parent=parent)
+
+    return FlushResult(table._name, mode, len(records), written, time.perf_counter() - start)
+
+
+def coalesce_edits(entries: Iterable[Sequence[Any]]) -> dict[int, str]:
+    """Collapse a window of `(message_id, timestamp, content)` edits to the final content of each message."""
+    latest: dict[int, str] = {}
+    for message_id, _, content in entries:
+        latest[message_id] = content
+    return latest
+
+
+async def apply_deletes(connection: asyncpg.Connection, table: type[Table], message_ids: Iterable[int]) -> int:
+    """Mark messages as deleted, returning the number of logged messages affected."""
+    status = await connection.execute(
+        f"""
+        UPDATE {table._name} AS m SET deleted = TRUE
+        FROM unnest($1::bigint[]) AS d(message_id)
+        WHERE m.message_id = d.message_id
+        """,
+        list(set(message_ids)),
+    )
+    return _row_count(status)
+
+
+async def apply_edits(
+    connection: asyncpg.Connection, table: type[Table], history: type[Table], entries: ColumnarBatch
+) -> int:
+    """Apply a window of message edits, returning the number of edit history rows inserted.
+
+    Content is updated once per message with its final edit, while every edit
+    of a logged message is recorded in the edit history. New messages have no
+    edit history, so the first edit of a message also records its original
+    content, dated at the message's creation.
+    """
+    latest = coalesce_edits(entries)
+    await connection.execute(
+        f"""
+        INSERT INTO {history._name} (message_id, created_at, content)
+        SELECT m.message_id, {snowflake_time("m.message_id")}, m.content
+        FROM {table._name} AS m
+        WHERE m.message_id = ANY($1::bigint[])
+            AND NOT EXISTS (SELECT 1 FROM {history._name} AS h WHERE h.message_id = m.message_id)
+        ON CONFLICT DO NOTHING
+        """,
+        list(latest.keys()),
+    )
+    await connection.execute(
+        f"""
+        UPDATE {table._name} AS m SET content = e.content
+        FROM unnest($1::bigint[], $2::text[]) AS e(message_id, content)
+        WHERE m.message_id = e.message_id
+        """,
+        list(latest.keys()),
+        list(latest.values()),
+    )
+
+    status = await connection.execute(
+        f"""
+        INSERT INTO {history._name} (message_id, created_at, content)
+        SELECT e.message_id, e.created_at, e.content
+        FROM unnest($1::bigint[], $2::timestamp[], $3::text[]) AS e(message_id, created_at, content)
+        WHERE EXISTS (SELECT 1 FROM {table._name} AS m WHERE m.message_id = e.message_id)
+        ON CONFLICT DO NOTHING
+        """,
+        entries.column("message_id"),
+        list(entries.column("timestamp")),
+        list(entries.column("content")),
+    )
+    return _row_count(status)
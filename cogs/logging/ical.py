@@ -0,0 +1,96 @@
+import datetime
+
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+from typing import BinaryIO, Optional
+
+from .db import Status
+
+
+Interval = tuple[Optional[Status], datetime.datetime, datetime.timedelta]
+
+MIN_EVENT_DURATION = datetime.timedelta(minutes=1)
+
+PRODUCT_ID = "-//BotBot//Status Log//EN"
+
+
+def format_datetime(dt: datetime.datetime) -> str:
+    return dt.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def fold(line: str) -> str:
+    """Fold a content line to at most 75 octets per line, as RFC 5545 requires."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+
+    lines = []
+    while encoded:
+        limit = 75 if not lines else 74
+        # Don't split a multi-byte character
+        while limit < len(encoded) and encoded[limit] & 0xC0 == 0x80:
+            limit -= 1
+        lines.append(encoded[:limit].decode())
+        encoded = encoded[limit:]
+    return "\r\n ".join(lines) + "\r\n"
+
+
+async def merge_intervals(
+    intervals: AsyncIterable[Interval], *, min_duration: datetime.timedelta = MIN_EVENT_DURATION
+) -> AsyncIterator[Interval]:
+    """Merge consecutive intervals in the same status.
+
+    Intervals shorter than `min_duration` are absorbed into the interval before them, so a
+    brief change of status doesn't split an otherwise continuous event.
+    """
+    current: Optional[Interval] = None
+
+    async for status, start, duration in intervals:
+        if current is not None:
+            current_status, current_start, _ = current
+            if status == current_status or duration < min_duration:
+                current = (current_status, current_start, start + duration - current_start)
+                continue
+            yield current
+
+        elif duration < min_duration:
+            continue
+
+        current = (status, start, duration)
+
+    if current is not None:
+        yield current
+
+
+def event_lines(
+    user_id: int, status: Status, start: datetime.datetime, duration: datetime.timedelta, *, stamp: datetime.datetime
+) -> Iterator[str]:
+    yield "BEGIN:VEVENT"
+    yield f"UID:{user_id}-{int(start.timestamp())}@botbot"
+    yield f"DTSTAMP:{format_datetime(stamp)}"
+    yield f"DTSTART:{format_datetime(start)}"
+    yield f"DTEND:{format_datetime(start + duration)}"
+    yield f"SUMMARY:User was {status.name}"
+    yield "END:VEVENT"
+
+
+async def write_calendar(fp: BinaryIO, user_id: int, intervals: AsyncIterable[Interval]) -> int:
+    """Write an RFC 5545 calendar of status intervals to a file as they arrive.
+
+    Intervals without a status are skipped, returns the number of events written.
+    """
+    # Every event is stamped with the time the calendar was exported
+    stamp = datetime.datetime.now(datetime.timezone.utc)
+
+    fp.write(fold("BEGIN:VCALENDAR").encode())
+    fp.write(fold("VERSION:2.0").encode())
+    fp.write(fold(f"PRODID:{PRODUCT_ID}").encode())
+
+    events = 0
+    async for status, start, duration in intervals:
+        if status is None:
+            continue
+        fp.write("".join(fold(line) for line in event_lines(user_id, status, start, duration, stamp=stamp)).encode())
+        events += 1
+
+    fp.write(fold("END:VCALENDAR").encode())
+    return events
@@ -0,0 +1,122 @@
+import bisect
+
+from collections import defaultdict
+from collections.abc import Iterable
+from typing import Optional
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Labels, **extra: str) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    """A cumulative histogram with fixed bucket bounds."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        total = 0
+        out = []
+        for bound, count in zip((*map(str, self.buckets), "+Inf"), self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+    def quantile(self, q: float) -> Optional[float]:
+        """An upper bound on the given quantile, taken from the bucket bounds."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Counters, gauges and histograms which can be rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.help: dict[str, tuple[str, str]] = {}
+        self.counters: dict[str, dict[Labels, float]] = defaultdict(dict)
+        self.gauges: dict[str, dict[Labels, float]] = defaultdict(dict)
+        self.histograms: dict[str, dict[Labels, Histogram]] = defaultdict(dict)
+
+    def describe(self, name: str, kind: str, description: str) -> None:
+        self.help[name] = (kind, description)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        self.counters[name][key] = self.counters[name].get(key, 0) + value
+
+    def set_total(self, name: str, value: float, **labels: str) -> None:
+        """Set a counter which is tracked elsewhere to its current total."""
+        self.counters[name][_labels(labels)] = value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self.gauges[name][_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        if key not in self.histograms[name]:
+            self.histograms[name][key] = Histogram()
+        self.histograms[name][key].observe(value)
+
+    def value(self, name: str, **labels: str) -> float:
+        key = _labels(labels)
+        return self.counters.get(name, {}).get(key) or self.gauges.get(name, {}).get(key) or 0
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        return self.histograms.get(name, {}).get(_labels(labels))
+
+    def prometheus(self) -> str:
+        lines: list[str] = []
+
+        def header(name: str, default_kind: str) -> None:
+            kind, description = self.help.get(name, (default_kind, ""))
+            if description:
+                lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name, series in sorted(self.counters.items()):
+            header(name, "counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+        for name, series in sorted(self.gauges.items()):
+            header(name, "gauge")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+        for name, series in sorted(self.histograms.items()):
+            header(name, "histogram")
+            for labels, histogram in sorted(series.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,55 @@
+from collections.abc import Iterable, Iterator, Mapping
+from typing import Any, NamedTuple, Optional
+
+
+class OptIn(NamedTuple):
+    public: bool = False
+    nsfw: bool = False
+
+
+class OptInCache:
+    """The logging preferences of every opted in user, held in memory.
+
+    This is loaded from the database once the logging cog starts and is updated by
+    the logging commands, which makes it authoritative for this process.
+
+    `entries` is only ever updated in place, so hot paths can keep a reference to it
+    and check membership with a plain dict lookup.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.entries: dict[int, OptIn] = {}
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.entries)
+
+    def load(self, records: Iterable[Mapping[str, Any]]) -> None:
+        self.entries.clear()
+        self.entries.update((record["user_id"], OptIn(record["public"], record["nsfw"])) for record in records)
+        self.loaded = True
+
+    def get(self, user_id: int) -> Optional[OptIn]:
+        return self.entries.get(user_id)
+
+    def get_many(self, user_ids: Iterable[int]) -> dict[int, Optional[OptIn]]:
+        return {user_id: self.entries.get(user_id) for user_id in user_ids}
+
+    def add(self, user_id: int, *, public: bool = False, nsfw: bool = False) -> None:
+        self.entries[user_id] = OptIn(public, nsfw)
+
+    def update(self, user_id: int, **preferences: bool) -> None:
+        self.entries[user_id] = self.entries.get(user_id, OptIn())._replace(**preferences)
+
+    def remove(self, user_id: int) -> None:
+        self.entries.pop(user_id, None)
+
+    def logs_nsfw(self, user_id: int) -> bool:
+        entry = self.entries.get(user_id)
+        return entry is not None and entry.nsfw
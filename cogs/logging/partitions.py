@@ -0,0 +1,282 @@
+import datetime
+import json
+
+from collections.abc import Callable
+from typing import Any, NamedTuple, Optional
+
+import asyncpg
+import discord
+from donphan import Table
+
+from .db import MessageLog, StatusLog
+
+
+class PartitionSpec(NamedTuple):
+    """How a table is range partitioned by month.
+
+    `bound` converts the start of a month to a SQL literal on the partition column,
+    `month_of` converts a partition column value to the time it was written.
+    """
+
+    table: type[Table]
+    column: str
+    bound: Callable[[datetime.datetime], str]
+    month_of: Callable[[Any], datetime.datetime]
+
+
+class Partition(NamedTuple):
+    name: str
+    month: Optional[datetime.datetime]
+    rows: int
+
+
+def _as_utc(dt: datetime.datetime) -> datetime.datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc)
+
+
+def _timestamp_bound(month: datetime.datetime) -> str:
+    return month.strftime("'%Y-%m-%d %H:%M:%S+00'")
+
+
+def _snowflake_bound(month: datetime.datetime) -> str:
+    return str(max(discord.utils.time_snowflake(month), 0))
+
+
+PARTITIONED_TABLES: dict[str, PartitionSpec] = {
+    "status": PartitionSpec(StatusLog, "timestamp", _timestamp_bound, _as_utc),
+    "message": PartitionSpec(MessageLog, "message_id", _snowflake_bound, discord.utils.snowflake_time),
+}
+
+
+def month_start(dt: datetime.datetime) -> datetime.datetime:
+    dt = _as_utc(dt)
+    return datetime.datetime(dt.year, dt.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month: datetime.datetime, months: int) -> datetime.datetime:
+    year, month_index = divmod(month.month - 1 + months, 12)
+    return month.replace(year=month.year + year, month=month_index + 1)
+
+
+def partition_name(spec: PartitionSpec, month: datetime.datetime) -> str:
+    return f"{spec.table._name}_{month:%Y_%m}"
+
+
+def _local_name(name: str) -> str:
+    return name.rsplit(".", 1)[-1]
+
+
+def _schema_name(name: str) -> str:
+    return name.rsplit(".", 1)[0]
+
+
+async def is_partitioned(connection: asyncpg.Connection, spec: PartitionSpec) -> bool:
+    return await connection.fetchval(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = $1::regclass)", spec.table._name
+    )
+
+
+async def get_partitions(connection: asyncpg.Connection, spec: PartitionSpec) -> list[Partition]:
+    """Fetch the partitions of a table with their estimated row counts, oldest first."""
+    records = await connection.fetch(
+        """
+        SELECT c.relname AS name, c.reltuples::bigint AS rows FROM pg_inherits AS i
+        INNER JOIN pg_class AS c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+        ORDER BY c.relname;
+        """,
+        spec.table._name,
+    )
+
+    partitions = []
+    for record in records:
+        try:
+            month = datetime.datetime.strptime(record["name"][-7:], "%Y_%m").replace(tzinfo=datetime.timezone.utc)
+        except ValueError:
+            month = None
+        partitions.append(Partition(record["name"], month, max(record["rows"], 0)))
+    return partitions
+
+
+async def create_partition(connection: asyncpg.Connection, spec: PartitionSpec, month: datetime.datetime) -> None:
+    await connection.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(spec, month)} PARTITION OF {spec.table._name}
+        FOR VALUES FROM ({spec.bound(month)}) TO ({spec.bound(add_months(month, 1))});
+        """
+    )
+
+
+async def ensure_partitions(connection: asyncpg.Connection, spec: PartitionSpec, *, ahead: int) -> None:
+    """Create the partitions for this month and the next `ahead` months."""
+    month = month_start(discord.utils.utcnow())
+    for offset in range(ahead + 1):
+        await create_partition(connection, spec, add_months(month, offset))
+
+
+async def _get_references(connection: asyncpg.Connection, spec: PartitionSpec) -> list[asyncpg.Record]:
+    """Fetch the single column foreign keys which reference a table."""
+    return await connection.fetch(
+        """
+        SELECT c.conrelid::regclass::text AS referrer, a.attname AS column, f.attname AS referenced
+        FROM pg_constraint AS c
+        INNER JOIN pg_attribute AS a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+        INNER JOIN pg_attribute AS f ON f.attrelid = c.confrelid AND f.attnum = c.confkey[1]
+        WHERE c.confrelid = $1::regclass AND c.contype = 'f';
+        """,
+        spec.table._name,
+    )
+
+
+async def drop_partitions(connection: asyncpg.Connection, spec: PartitionSpec, before: datetime.datetime) -> list[str]:
+    """Detach and drop every monthly partition which ends on or before a given time.
+
+    Rows of other tables referencing a partition, such as the attachments and edit history of
+    logged messages, are deleted with it as the partition can't be detached while they exist.
+    Returns the names of the dropped partitions.
+    """
+    references = await _get_references(connection, spec)
+
+    dropped = []
+    for partition in await get_partitions(connection, spec):
+        if partition.month is None or add_months(partition.month, 1) > _as_utc(before):
+            continue
+
+        name = f"{_schema_name(spec.table._name)}.{partition.name}"
+        async with connection.transaction():
+            for reference in references:
+                await connection.execute(
+                    f"""
+                    DELETE FROM {reference['referrer']} AS r USING {name} AS p
+                    WHERE r."{reference['column']}" = p."{reference['referenced']}";
+                    """
+                )
+            await connection.execute(f"ALTER TABLE {spec.table._name} DETACH PARTITION {name};")
+            await connection.execute(f"DROP TABLE {name};")
+        dropped.append(partition.name)
+
+    return dropped
+
+
+def _unpartitioned_name(spec: PartitionSpec) -> str:
+    return f"{spec.table._name}_unpartitioned"
+
+
+async def is_migrating(connection: asyncpg.Connection, spec: PartitionSpec) -> bool:
+    """Whether a migration to a partitioned table was started and hasn't finished."""
+    return await connection.fetchval("SELECT to_regclass($1) IS NOT NULL;", _unpartitioned_name(spec))
+
+
+async def _get_primary_key(connection: asyncpg.Connection, table: str) -> list[str]:
+    records = await connection.fetch(
+        """
+        SELECT a.attname AS name FROM pg_index AS i
+        INNER JOIN pg_attribute AS a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = $1::regclass AND i.indisprimary;
+        """,
+        table,
+    )
+    return [record["name"] for record in records]
+
+
+async def migrate_to_partitioned(connection: asyncpg.Connection, spec: PartitionSpec, *, ahead: int) -> int:
+    """Convert an existing table to a table partitioned by month.
+
+    The table is renamed, replaced with a partitioned copy and its rows are copied
+    across one month at a time so no single transaction holds locks for long. Until
+    the copy finishes readers only see the months copied so far.
+    Once every row of the old table is found in the new one the foreign keys referencing
+    the table are recreated and the old table is dropped. An interrupted migration is
+    resumed from the first month which wasn't copied.
+    Returns the number of rows copied.
+    """
+    table = spec.table._name
+    column = f'"{spec.column}"'
+    old = _unpartitioned_name(spec)
+
+    if await is_migrating(connection, spec):
+        references = json.loads(await connection.fetchval("SELECT obj_description($1::regclass, 'pg_class');", old))
+    else:
+        async with connection.transaction():
+            records = await connection.fetch(
+                """
+                SELECT conname AS name, conrelid::regclass::text AS referrer, pg_get_constraintdef(oid) AS definition
+                FROM pg_constraint WHERE confrelid = $1::regclass AND contype = 'f';
+                """,
+                table,
+            )
+            references = [dict(record) for record in records]
+            for reference in references:
+                await connection.execute(f"ALTER TABLE {reference['referrer']} DROP CONSTRAINT {reference['name']};")
+
+            await connection.execute(f"ALTER TABLE {table} RENAME TO {_local_name(old)};")
+            await connection.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING ALL) PARTITION BY RANGE ({column});")
+            await connection.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;")
+
+            # The dropped foreign keys are kept with the old table so an interrupted migration can restore them
+            comment = await connection.fetchval("SELECT quote_literal($1);", json.dumps(references))
+            await connection.execute(f"COMMENT ON TABLE {old} IS {comment};")
+
+    oldest = await connection.fetchval(f"SELECT min({column}) FROM {old};")
+    now = month_start(discord.utils.utcnow())
+    month = month_start(spec.month_of(oldest)) if oldest is not None else now
+
+    months = []
+    while month <= add_months(now, ahead):
+        await create_partition(connection, spec, month)
+        months.append(month)
+        month = add_months(month, 1)
+
+    copied = 0
+    for month in months:
+        lower, upper = spec.bound(month), spec.bound(add_months(month, 1))
+
+        # Each month is copied in a single transaction, so if its last row is there all of it is
+        done = await connection.fetchval(
+            f"""
+            SELECT EXISTS (
+                SELECT 1 FROM {table}
+                WHERE {column} = (SELECT max({column}) FROM {old} WHERE {column} >= {lower} AND {column} < {upper})
+            );
+            """
+        )
+        if done:
+            continue
+
+        async with connection.transaction():
+            status = await connection.execute(
+                f"""
+                INSERT INTO {table} SELECT * FROM {old}
+                WHERE {column} >= {lower} AND {column} < {upper}
+                ON CONFLICT DO NOTHING;
+                """
+            )
+        copied += int(status.rsplit(" ", 1)[1])
+
+    async with connection.transaction():
+        # Anything outside the monthly ranges lands in the default partition
+        status = await connection.execute(
+            f"""
+            INSERT INTO {table} SELECT * FROM {old}
+            WHERE {column} >= {spec.bound(add_months(months[-1], 1))}
+            ON CONFLICT DO NOTHING;
+            """
+        )
+        copied += int(status.rsplit(" ", 1)[1])
+
+        key = " AND ".join(f'n."{name}" = o."{name}"' for name in await _get_primary_key(connection, old))
+        missing = await connection.fetchval(
+            f"SELECT count(*) FROM {old} AS o WHERE NOT EXISTS (SELECT 1 FROM {table} AS n WHERE {key});"
+        )
+        if missing:
+            raise RuntimeError(f"{missing} rows of {old} were not copied, it has been kept.")
+
+        for reference in references:
+            await connection.execute(
+                f"ALTER TABLE {reference['referrer']} ADD CONSTRAINT {reference['name']} {reference['definition']};"
+            )
+        await connection.execute(f"DROP TABLE {old};")
+
+    return copied
@@ -0,0 +1,75 @@
+import time
+
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import discord
+
+from .db import Status
+
+
+class PresenceState(NamedTuple):
+    status: Status
+    raw: discord.Status
+    changed_at: float
+
+
+class PresenceTracker:
+    """The last logged status of each user, used to drop presence updates which don't change it.
+
+    A user in several guilds with the bot produces one update per guild for each
+    change. Once a change has been seen, updates repeating it within `window`
+    seconds are coalesced by comparing the raw discord status alone. Later updates
+    are compared by their logged status. The raw status is kept current even when
+    the logged status doesn't change, such as while streaming.
+
+    At most `max_users` users are tracked, the least recently changed are forgotten first.
+    """
+
+    def __init__(self, *, window: float, max_users: int):
+        self.window = window
+        self.max_users = max_users
+        self._states: OrderedDict[int, PresenceState] = OrderedDict()
+
+        self.changes = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get(self, user_id: int) -> Optional[Status]:
+        state = self._states.get(user_id)
+        return state.status if state is not None else None
+
+    def is_repeat(self, user_id: int, raw: discord.Status) -> bool:
+        """Whether a status change was just logged from another guild's update."""
+        state = self._states.get(user_id)
+        if state is not None and state.raw is raw and time.monotonic() - state.changed_at < self.window:
+            self.coalesced += 1
+            return True
+        return False
+
+    def update(self, user_id: int, status: Status, raw: discord.Status) -> bool:
+        """Record a user's status, returns whether it changed."""
+        state = self._states.get(user_id)
+        if state is not None and state.status == status:
+            # Repeats of this update are compared against the raw status it carried
+            if state.raw is not raw:
+                self._states[user_id] = PresenceState(status, raw, time.monotonic())
+            self.unchanged += 1
+            return False
+
+        self._states[user_id] = PresenceState(status, raw, time.monotonic())
+        self._states.move_to_end(user_id)
+        self.changes += 1
+
+        while len(self._states) > self.max_users:
+            self._states.popitem(last=False)
+            self.evicted += 1
+
+        return True
+
+    def remove(self, user_id: int) -> None:
+        self._states.pop(user_id, None)
@@ -0,0 +1,74 @@
+from functools import lru_cache
+
+import numpy
+from PIL import Image, ImageDraw, ImageFont
+
+
+TRANSPARENT = (0, 0, 0, 0)
+
+
+@lru_cache(maxsize=16)
+def get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(path, size)
+
+
+def rasterize_timeline(
+    ends: numpy.ndarray,
+    colours: numpy.ndarray,
+    *,
+    start: float,
+    rows: int,
+    width: int,
+    row_seconds: float,
+    first_row: int = 0,
+) -> numpy.ndarray:
+    """Rasterize consecutive intervals onto rows of a timeline.
+
+    `ends` holds the end of each interval in seconds from the start of the first row,
+    the first interval starting at `start`. Each pixel takes the colour of the interval
+    covering its centre, pixels outside every interval are transparent. Only the rows
+    from `first_row` onwards are rasterized.
+
+    Returns an RGBA array of shape `(rows, width, 4)`.
+    """
+    pixels = numpy.zeros((rows * width, 4), dtype=numpy.uint8)
+    if not len(ends):
+        return pixels.reshape(rows, width, 4)
+
+    centres = (numpy.arange(first_row * width, (first_row + rows) * width, dtype=numpy.float64) + 0.5) * (
+        row_seconds / width
+    )
+    indexes = numpy.searchsorted(ends, centres, side="right")
+    covered = (centres >= start) & (indexes < len(ends))
+
+    pixels[covered] = colours[indexes[covered]]
+    return pixels.reshape(rows, width, 4)
+
+
+def expand_rows(rows: numpy.ndarray, row_height: float, height: int) -> numpy.ndarray:
+    """Repeat each row of pixels to fill `row_height` pixels of an image `height` pixels tall."""
+    row_indexes = numpy.minimum(((numpy.arange(height) + 0.5) / row_height).astype(numpy.intp), len(rows) - 1)
+    return rows[row_indexes]
+
+
+@lru_cache(maxsize=8)
+def grid_layer(
+    width: int,
+    height: int,
+    top: int,
+    line_width: int,
+    major: tuple[int, int, int, int],
+    minor: tuple[int, int, int, int],
+) -> Image.Image:
+    """Hour lines below a label row, every sixth hour is drawn in the major colour.
+
+    The layer is cached so it must not be modified.
+    """
+    layer = Image.new("RGBA", (width, height), TRANSPARENT)
+    draw = ImageDraw.Draw(layer)
+
+    for hour in range(1, 24):
+        x_offset = width * hour // 24
+        draw.line((x_offset, top, x_offset, height), fill=major if not hour % 6 else minor, width=line_width)
+
+    return layer
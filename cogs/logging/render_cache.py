@@ -0,0 +1,61 @@
+import time
+
+from collections import Counter, OrderedDict
+from collections.abc import Hashable
+from typing import Optional
+
+
+class RenderCache:
+    """An LRU cache of encoded images which expire after a fixed time.
+
+    Entries are evicted least recently used first once the total size of the cached
+    images passes `max_bytes`. Keys should include whatever the image was rendered
+    from, so a stale image is never looked up rather than needing to be invalidated.
+    """
+
+    def __init__(self, *, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[float, bytes]] = OrderedDict()
+
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable) -> None:
+        _, data = self._entries.pop(key)
+        self.bytes -= len(data)
+
+    def get(self, kind: str, key: Hashable) -> Optional[bytes]:
+        entry = self._entries.get((kind, key))
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove((kind, key))
+            self.misses[kind] += 1
+            return None
+
+        self._entries.move_to_end((kind, key))
+        self.hits[kind] += 1
+        return entry[1]
+
+    def put(self, kind: str, key: Hashable, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        if (kind, key) in self._entries:
+            self._remove((kind, key))
+
+        self._entries[kind, key] = (time.monotonic() + self.ttl, data)
+        self.bytes += len(data)
+
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evicted += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
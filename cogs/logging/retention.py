@@ -0,0 +1,118 @@
+import asyncio
+import datetime
+
+from typing import Optional
+
+import asyncpg
+import discord
+from donphan import MaybeAcquire
+
+from .db import StatusLog, StatusRollup
+
+
+Cursor = tuple[int, datetime.date]
+
+
+# Every transition before the end of the chunk is removed. The status in effect at the end of the chunk is kept
+# as a boundary entry there, so the status log still knows the user's status from then on and the following
+# day is complete. A transition already at the end of the chunk is its own boundary.
+VACUUM_CHUNK = f"""
+    WITH last AS (
+        SELECT status FROM {StatusLog._name}
+        WHERE user_id = $1 AND "timestamp" < $2
+        ORDER BY "timestamp" DESC LIMIT 1
+    ), boundary AS (
+        INSERT INTO {StatusLog._name} (user_id, "timestamp", status)
+        SELECT $1, $2, status FROM last
+        ON CONFLICT (user_id, "timestamp") DO NOTHING
+    ), deleted AS (
+        DELETE FROM {StatusLog._name}
+        WHERE user_id = $1 AND "timestamp" < $2
+        RETURNING 1
+    )
+    SELECT count(*) FROM deleted;
+"""
+
+
+class VacuumProgress:
+    """Progress of a status log vacuum, users are processed in order a chunk of days at a time."""
+
+    def __init__(self, cutoff: datetime.datetime):
+        self.cutoff = cutoff
+        self.started_at = discord.utils.utcnow()
+        self.finished_at: Optional[datetime.datetime] = None
+        self.chunks = 0
+        self.rows = 0
+        self.cursor: Optional[Cursor] = None
+
+    def __str__(self) -> str:
+        if self.finished_at is not None:
+            state = f"finished at {self.finished_at:%Y-%m-%d %H:%M}"
+        elif self.cursor is not None:
+            state = f"at user {self.cursor[0]} on {self.cursor[1]:%Y-%m-%d}"
+        else:
+            state = "starting"
+        return f"Removed {self.rows} entries older than {self.cutoff:%Y-%m-%d} in {self.chunks} chunks, {state}."
+
+
+async def next_user(
+    connection: asyncpg.Connection, cutoff: datetime.datetime, after: int
+) -> Optional[tuple[int, datetime.date]]:
+    """Find the next user with entries older than the cutoff and the day of their oldest entry."""
+    record = await connection.fetchrow(
+        f"""
+        SELECT user_id, "timestamp" FROM {StatusLog._name}
+        WHERE user_id > $1 AND "timestamp" < $2
+        ORDER BY user_id, "timestamp"
+        LIMIT 1;
+        """,
+        after,
+        cutoff,
+    )
+    if record is None:
+        return None
+    return record["user_id"], record["timestamp"].date()
+
+
+async def vacuum_chunk(connection: asyncpg.Connection, user_id: int, start: datetime.date, end: datetime.date) -> int:
+    """Compact a user's days from start up to end into the rollup, then remove their entries.
+
+    Both happen in a single transaction, returns the number of entries removed.
+    """
+    async with connection.transaction():
+        await StatusRollup.refresh_days(connection, user_id, start, end)
+        return await connection.fetchval(
+            VACUUM_CHUNK, user_id, datetime.datetime.combine(end, datetime.time(), datetime.timezone.utc)
+        )
+
+
+async def vacuum_status_log(
+    pool: asyncpg.Pool, progress: VacuumProgress, *, chunk_days: int, pause: float
+) -> VacuumProgress:
+    """Remove every status log entry older than the progress cutoff, one short transaction per chunk.
+
+    Each run starts again from the first user. Users an earlier run finished have no entries
+    before the cutoff left and are passed over.
+    """
+    cutoff = progress.cutoff.date()
+    user_id = 0
+
+    while True:
+        async with MaybeAcquire(pool=pool) as connection:
+            found = await next_user(connection, progress.cutoff, user_id)
+        if found is None:
+            break
+
+        user_id, day = found
+        while day < cutoff:
+            end = min(day + datetime.timedelta(days=chunk_days), cutoff)
+            async with MaybeAcquire(pool=pool) as connection:
+                progress.rows += await vacuum_chunk(connection, user_id, day, end)
+
+            progress.chunks += 1
+            progress.cursor = (user_id, end)
+            day = end
+            await asyncio.sleep(pause)
+
+    progress.finished_at = discord.utils.utcnow()
+    return progress
@@ -0,0 +1,114 @@
+import asyncio
+import glob
+import os
+import pickle
+import struct
+import zlib
+
+from collections.abc import Iterator
+from typing import Any, BinaryIO, Optional
+
+
+HEADER = struct.Struct("<II")
+
+
+def _fsync(fd: int) -> None:
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Spool:
+    """An append-only write-ahead log of buffered log entries.
+
+    Records are length-prefixed and checksummed pickles written to numbered
+    segment files. Writes only reach the OS buffers, :meth:`sync` fsyncs them
+    in batches off the event loop. Before a flush or a spill the current segment
+    is rotated, once the entries are flushed or spilled the earlier segments are
+    removed.
+
+    Segments left behind by a previous process are replayed with :meth:`replay`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pending = 0
+
+        self._stale = sorted(glob.glob(f"{glob.escape(path)}.*[0-9]"))
+        self._segment = max((self._segment_number(p) for p in self._stale), default=0)
+        self._fp: Optional[BinaryIO] = None
+        self._open()
+
+    @staticmethod
+    def _segment_number(path: str) -> int:
+        return int(path.rsplit(".", 1)[1])
+
+    def _segment_path(self, segment: int) -> str:
+        return f"{self.path}.{segment:08d}"
+
+    def _open(self) -> None:
+        self._segment += 1
+        self._fp = open(self._segment_path(self._segment), "ab")
+
+    def write(self, name: str, values: tuple) -> None:
+        payload = pickle.dumps((name, values), protocol=pickle.HIGHEST_PROTOCOL)
+        self._fp.write(HEADER.pack(len(payload), zlib.crc32(payload)) + payload)  # type: ignore
+        self.pending += 1
+
+    async def sync(self) -> None:
+        """Flush pending writes to disk without blocking the event loop."""
+        if not self.pending:
+            return
+        self.pending = 0
+        self._fp.flush()  # type: ignore
+        await asyncio.get_running_loop().run_in_executor(None, _fsync, os.dup(self._fp.fileno()))  # type: ignore
+
+    def rotate(self) -> int:
+        """Start a new segment, returning a checkpoint covering every record written so far.
+
+        The finished segment is fsynced in the executor.
+        """
+        self._fp.flush()  # type: ignore
+        fd = os.dup(self._fp.fileno())  # type: ignore
+        self._fp.close()  # type: ignore
+        self.pending = 0
+        self._open()
+        asyncio.get_running_loop().run_in_executor(None, _fsync, fd)
+        return self._segment
+
+    def release(self, checkpoint: int, *, after: int = 0) -> None:
+        """Remove the segments written between two checkpoints, by default all of those before `checkpoint`."""
+        for path in glob.glob(f"{glob.escape(self.path)}.*[0-9]"):
+            if after <= self._segment_number(path) < checkpoint:
+                os.remove(path)
+
+    @staticmethod
+    def _read(fp: BinaryIO) -> Iterator[tuple[str, Any]]:
+        while True:
+            header = fp.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            length, checksum = HEADER.unpack(header)
+            payload = fp.read(length)
+            # A short or corrupt record means the process died mid-write
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            yield pickle.loads(payload)
+
+    def replay(self) -> Iterator[tuple[str, Any]]:
+        """Yield the records of segments left behind by a previous process.
+
+        These segments are removed by the first successful flush after replaying.
+        """
+        stale, self._stale = self._stale, []
+        for path in stale:
+            with open(path, "rb") as fp:
+                yield from self._read(fp)
+
+    def close(self) -> None:
+        if self._fp is not None:
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._fp.close()
+            self._fp = None
@@ -1,33 +1,44 @@
 import datetime
+import hashlib
 
 from collections import Counter
-from collections.abc import Iterable
-from io import BytesIO, StringIO
-from functools import partial
+from collections.abc import AsyncIterator, Iterable
+from io import BytesIO
+from functools import lru_cache
 from typing import Iterator, cast, NamedTuple, Optional
 
 import asyncpg
 from discord.utils import get
 import numpy
-
-from ics import Calendar, Event
-from PIL import Image, ImageChops, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
 import discord
 from discord.ext import commands
 
-from ditto import BotBase, Cog, Context
+from ditto import BotBase, Cog, Context, CONFIG as BOT_CONFIG
 from ditto.db import TimeZones
 from ditto.types.converters import PosixFlags
 from ditto.utils.strings import utc_offset
 
+from .avatars import AvatarCache, circular_avatar
 from .core import COLOURS, COLOURS_OLD
-from .db import OptInStatus, Status, StatusLog
+from .db import OptInStatus, Status, StatusLog, StatusRollup
+from .ical import merge_intervals, write_calendar
+from .raster import TRANSPARENT, expand_rows, get_font, grid_layer, rasterize_timeline
+from .render_cache import RenderCache
+from .tiles import TileCache
+
+
+CONFIG = BOT_CONFIG.EXTENSIONS[__name__]
 
 
 DISCORD_REBRAND_EPOCH = datetime.datetime(2021, 5, 13, 15, tzinfo=datetime.timezone.utc)
 
 MIN_DAYS = 7
+MAX_CALENDAR_DAYS = 366
+MAX_COMPARE_USERS = 10
+
+INTERVAL_CHUNK_SIZE = 1000
 
 IMAGE_SIZE = 4096
 DOWNSAMPLE = 2
@@ -40,6 +51,27 @@ WHITE = (255, 255, 255, 255)
 OPAQUE = (255, 255, 255, 128)
 TRANSLUCENT = (255, 255, 255, 32)
 
+COMPARE_ROW_HEIGHT = 96
+MAX_COMPARE_DATE_LABELS = 10
+
+# Days which ended this recently may still have transitions waiting to be flushed
+TILE_SETTLE_TIME = datetime.timedelta(minutes=5)
+
+AVATAR_CACHE = AvatarCache(CONFIG.AVATAR_CACHE_PATH, max_bytes=CONFIG.AVATAR_CACHE_MAX_BYTES)
+
+TILE_CACHE = TileCache(
+    max_bytes=CONFIG.TILE_CACHE_MAX_BYTES,
+    spill_path=CONFIG.TILE_CACHE_SPILL_PATH,
+    max_spill_bytes=CONFIG.TILE_CACHE_MAX_SPILL_BYTES,
+)
+
+RENDER_METRICS = (
+    ("logging_render_cache_hits_total", "counter", "Status images sent from the render cache."),
+    ("logging_render_cache_misses_total", "counter", "Status images which had to be rendered."),
+    ("logging_render_cache_evictions_total", "counter", "Status images evicted to keep the render cache in size."),
+    ("logging_render_cache_bytes", "gauge", "Size of the status images in the render cache."),
+)
+
 
 class LogEntry(NamedTuple):
     status: Optional[Status]
@@ -59,6 +91,11 @@ class StatusLogOptions(PosixFlags):
     _square: bool = True
 
 
+class StatusCompareOptions(PosixFlags):
+    show_labels: bool = commands.flag(aliases=["labels"], default=True)
+    num_days: int = commands.flag(aliases=["days"], default=7)
+
+
 def start_of_day(dt: datetime.datetime) -> datetime.datetime:
     return datetime.datetime.combine(dt, datetime.time()).astimezone(datetime.timezone.utc)
 
@@ -69,60 +106,178 @@ def get_colour(status: Optional[Status], time: datetime.datetime) -> tuple[int,
     return COLOURS[status]
 
 
-async def get_status_records(
-    connection: asyncpg.Connection, user: discord.User, *, days: int = 30
-) -> Iterable[asyncpg.Record]:
-    return await StatusLog.fetch_where(
-        connection,
-        f"user_id = $1 AND \"timestamp\" > CURRENT_DATE - INTERVAL '{days} days'",
-        user.id,
-        order_by=(StatusLog.timestamp, "ASC"),
-    )
+STATUS_INDEXES = {status: index for index, status in enumerate(COLOURS)}
+
+# Colours of each status by index, before and after the rebrand
+COLOUR_TABLE = numpy.array(
+    [
+        [get_colour(status, DISCORD_REBRAND_EPOCH) for status in COLOURS],
+        [get_colour(status, DISCORD_REBRAND_EPOCH - datetime.timedelta(seconds=1)) for status in COLOURS],
+    ],
+    dtype=numpy.uint8,
+)
+
+
+def get_colours(statuses: Iterable[Optional[Status]], starts: numpy.ndarray) -> numpy.ndarray:
+    """The colours of many entries at once, as :func:`get_colour`. `starts` are POSIX timestamps."""
+    indexes = numpy.fromiter((STATUS_INDEXES[status] for status in statuses), dtype=numpy.intp, count=len(starts))
+    return COLOUR_TABLE[(starts < DISCORD_REBRAND_EPOCH.timestamp()).astype(numpy.intp), indexes]
 
 
 async def get_status_totals(connection: asyncpg.Connection, user: discord.User, *, days: int = 30) -> Counter[Status]:
-    records = list(await get_status_records(connection, user, days=days))
+    since = discord.utils.utcnow().date() - datetime.timedelta(days=days)
+    records = await StatusRollup.get_totals(connection, user.id, since)
 
-    if not records:
+    total_duration = sum(record["seconds"] for record in records)
+    if not total_duration:
         return Counter()
 
-    status_totals: Counter[Status] = Counter()
+    return Counter({record["status"]: record["seconds"] / total_duration for record in records})
 
-    total_duration = (records[-1]["timestamp"] - records[0]["timestamp"]).total_seconds()
 
-    for i, record in enumerate(records[:-1]):
-        status_totals[record["status"]] += (
-            records[i + 1]["timestamp"] - record["timestamp"]
-        ).total_seconds() / total_duration
+def sql_timezone(timezone: datetime.tzinfo) -> str:
+    """The name Postgres should use for a timezone."""
+    key = getattr(timezone, "key", None) or getattr(timezone, "zone", None)
+    if key is not None:
+        return key
 
-    return status_totals
+    offset = timezone.utcoffset(None)
+    if offset is None:
+        return "UTC"
 
+    # POSIX style offsets count hours west of UTC
+    minutes = int(offset.total_seconds()) // 60
+    sign = "-" if minutes >= 0 else "+"
+    return f"UTC{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
 
-async def get_status_log(
+
+# The last transition lasts until now, timestamps are stored in UTC without a timezone so are read as UTC
+# rather than cast, which would use the session's timezone
+STATUS_INTERVALS = f"""
+    SELECT status, "timestamp" AT TIME ZONE 'UTC' AS start,
+        lead("timestamp" AT TIME ZONE 'UTC', 1, now()) OVER (ORDER BY "timestamp") AS finish
+    FROM {StatusLog._name}
+    WHERE user_id = $1 AND "timestamp" > $2
+"""
+
+
+async def get_status_intervals(
     connection: asyncpg.Connection,
     user: discord.User,
     *,
     days: int = 30,
+    timezone: Optional[datetime.tzinfo] = None,
 ) -> list[LogEntry]:
-    status_log: list[LogEntry] = []
+    """Fetch the intervals a user spent in each status, computed in SQL.
+
+    If a timezone is passed intervals are split at midnight in that timezone.
+    """
+    since = datetime.datetime.combine(
+        discord.utils.utcnow().date() - datetime.timedelta(days=days), datetime.time(), datetime.timezone.utc
+    )
+
+    if timezone is None:
+        query = f"""
+            SELECT status, start, finish - start AS duration FROM ({STATUS_INTERVALS}) AS t
+            ORDER BY start;
+        """
+        records = await connection.fetch(query, user.id, since)
+    else:
+        query = f"""
+            SELECT t.status, GREATEST(t.start, d.start) AS start,
+                LEAST(t.finish, d.finish) - GREATEST(t.start, d.start) AS duration
+            FROM ({STATUS_INTERVALS}) AS t
+            CROSS JOIN LATERAL generate_series(
+                date_trunc('day', t.start AT TIME ZONE $3), t.finish AT TIME ZONE $3, INTERVAL '1 day'
+            ) AS l(day)
+            CROSS JOIN LATERAL (
+                SELECT l.day AT TIME ZONE $3 AS start, (l.day + INTERVAL '1 day') AT TIME ZONE $3 AS finish
+            ) AS d
+            WHERE LEAST(t.finish, d.finish) > GREATEST(t.start, d.start)
+            ORDER BY start;
+        """
+        records = await connection.fetch(query, user.id, since, sql_timezone(timezone))
+
+    return [LogEntry(*record) for record in records]
+
+
+async def iter_status_intervals(
+    connection: asyncpg.Connection,
+    user: discord.User,
+    *,
+    days: int = 30,
+    chunk_size: int = INTERVAL_CHUNK_SIZE,
+) -> AsyncIterator[LogEntry]:
+    """Stream the intervals a user spent in each status through a server side cursor."""
+    since = datetime.datetime.combine(
+        discord.utils.utcnow().date() - datetime.timedelta(days=days), datetime.time(), datetime.timezone.utc
+    )
+    query = f"""
+        SELECT status, start, finish - start AS duration FROM ({STATUS_INTERVALS}) AS t
+        ORDER BY start;
+    """
+
+    async with connection.transaction():
+        cursor = await connection.cursor(query, user.id, since)
+        while True:
+            records = await cursor.fetch(chunk_size)
+            if not records:
+                return
+            for record in records:
+                yield LogEntry(*record)
+
 
-    # Fetch records from DB
-    records = list(await get_status_records(connection, user, days=days))
-    if not records:
+async def get_status_log(
+    connection: asyncpg.Connection,
+    user: discord.User,
+    *,
+    days: int = 30,
+    timezone: Optional[datetime.tzinfo] = None,
+) -> list[LogEntry]:
+    status_log = await get_status_intervals(connection, user, days=days, timezone=timezone)
+    if not status_log:
         return status_log
 
     # Add padding for missing data
-    records.insert(0, (None, start_of_day(records[0]["timestamp"]), None))
-    records.append((None, discord.utils.utcnow(), None))
-
-    # Add in bulk of data
-    for i, (_, start, status) in enumerate(records[:-1]):
-        _, end, _ = records[i + 1]
-        status_log.append(LogEntry(status, start, end - start))
+    first = status_log[0].start
+    status_log.insert(0, LogEntry(None, start_of_day(first), first - start_of_day(first)))
 
     return status_log
 
 
+async def get_status_intervals_many(
+    connection: asyncpg.Connection,
+    users: list[discord.User],
+    *,
+    days: int = 7,
+) -> tuple[datetime.datetime, dict[int, list[LogEntry]]]:
+    """Fetch the intervals several users spent in each status with a single query.
+
+    Returns the start of the period and each user's intervals.
+    """
+    since = datetime.datetime.combine(
+        discord.utils.utcnow().date() - datetime.timedelta(days=days), datetime.time(), datetime.timezone.utc
+    )
+    records = await connection.fetch(
+        f"""
+        SELECT user_id, status, "timestamp" AT TIME ZONE 'UTC' AS start,
+            lead("timestamp" AT TIME ZONE 'UTC', 1, now()) OVER (PARTITION BY user_id ORDER BY "timestamp")
+                - "timestamp" AT TIME ZONE 'UTC' AS duration
+        FROM {StatusLog._name}
+        WHERE user_id = ANY($1::bigint[]) AND "timestamp" > $2
+        ORDER BY user_id, "timestamp";
+        """,
+        [user.id for user in users],
+        since,
+    )
+
+    status_logs: dict[int, list[LogEntry]] = {user.id: [] for user in users}
+    for record in records:
+        status_logs[record["user_id"]].append(LogEntry(record["status"], record["start"], record["duration"]))
+
+    return since, status_logs
+
+
 def base_image(width: int = IMAGE_SIZE, height: int = IMAGE_SIZE) -> tuple[Image.Image, ImageDraw.ImageDraw]:
     image = Image.new("RGBA", (width, height))
     draw = ImageDraw.Draw(image)
@@ -146,21 +301,35 @@ def add(*tuples: Iterable[int]) -> tuple[int, ...]:
     return tuple(sum(items) for items in zip(*tuples))
 
 
-def draw_status_pie(status_totals: Counter, avatar_fp: Optional[BytesIO], *, show_totals: bool = True) -> BytesIO:
+def pie_size(show_totals: bool) -> int:
+    # Make pie max size if no totals
+    return int(IMAGE_SIZE * 0.66) if show_totals else IMAGE_SIZE
+
+
+def avatar_size(show_totals: bool) -> int:
+    return int(pie_size(show_totals) // 1.5)
 
+
+def draw_status_pie(
+    status_totals: Counter,
+    avatar_fp: Optional[BytesIO],
+    *,
+    show_totals: bool = True,
+    avatar_key: Optional[str] = None,
+) -> BytesIO:
+    """Draw a status pie.
+
+    If an avatar key is passed the masked avatar is read from the avatar cache, `avatar_fp`
+    is only needed when the cache doesn't have it.
+    """
     image, draw = base_image()
 
-    # Make pie max size if no totals
-    if not show_totals:
-        pie_size = IMAGE_SIZE
-        pie_offset = (0,) * 2
-    else:
-        pie_size = int(IMAGE_SIZE * 0.66)
-        pie_offset = (0, (IMAGE_SIZE - pie_size) // 2)
+    size = pie_size(show_totals)
+    pie_offset = (0, (IMAGE_SIZE - size) // 2)
 
     # Draw status pie
     pie_0 = add((0,) * 2, pie_offset)
-    pie_1 = add((pie_size,) * 2, pie_offset)
+    pie_1 = add((size,) * 2, pie_offset)
 
     degrees = 270.0
     for status, percentage in status_totals.most_common():
@@ -168,32 +337,20 @@ def draw_status_pie(status_totals: Counter, avatar_fp: Optional[BytesIO], *, sho
         degrees += 360 * percentage
         draw.pieslice((pie_0, pie_1), start, degrees, fill=COLOURS[status])
 
-    if avatar_fp is not None:
-        # Load avatar image
-        avatar = Image.open(avatar_fp)
-        if avatar.mode != "RGBA":
-            avatar = avatar.convert("RGBA")
-        avatar = avatar.resize((int(pie_size // 1.5),) * 2, resample=Image.LANCZOS)
-
-        # Apply circular mask to image
-        _, _, _, alpha = avatar.split()
-        if alpha.mode != "L":
-            alpha = alpha.convert("L")
-
-        mask = Image.new("L", avatar.size, 0)
-        draw = ImageDraw.Draw(mask)
-        draw.ellipse((0, 0) + avatar.size, fill=255)
-
-        mask = ImageChops.darker(mask, alpha)
-        avatar.putalpha(mask)
+    avatar = AVATAR_CACHE.get(avatar_key, avatar_size(show_totals)) if avatar_key is not None else None
+    if avatar is None and avatar_fp is not None:
+        avatar = circular_avatar(avatar_fp, avatar_size(show_totals))
+        if avatar_key is not None:
+            AVATAR_CACHE.put(avatar_key, avatar_size(show_totals), avatar)
 
+    if avatar is not None:
         # Overlay avatar
-        image.paste(avatar, add((pie_size // 6,) * 2, pie_offset), avatar)
+        image.paste(avatar, add((size // 6,) * 2, pie_offset), avatar)
 
     # Add status percentages
     if show_totals:
         draw = ImageDraw.Draw(image)
-        font = ImageFont.truetype("res/roboto-bold.ttf", IMAGE_SIZE // 20)
+        font = get_font("res/roboto-bold.ttf", IMAGE_SIZE // 20)
 
         x_offset = IMAGE_SIZE // 4 * 3
         y_offset = IMAGE_SIZE // 3
@@ -216,6 +373,45 @@ def draw_status_pie(status_totals: Counter, avatar_fp: Optional[BytesIO], *, sho
     return as_bytes(resample(image))
 
 
+@lru_cache(maxsize=32)
+def label_layer(width: int, height: int, row_height: float, font_size: int, timezone_label: str) -> Image.Image:
+    """Hour lines and the label row of a status log, which only depend on its size and timezone."""
+    layer = grid_layer(width, height, round(row_height), 4, WHITE, OPAQUE).copy()
+    draw = ImageDraw.Draw(layer)
+
+    # Set offsets based on font size
+    font = get_font("res/roboto-bold.ttf", font_size)
+    text_half_width, text_height = draw.textsize("ｱ" * 2, font=font)
+    height_offset = (row_height - text_height) // 2
+
+    # Add timezone label
+    draw.text((text_half_width, height_offset), timezone_label, font=font, align="left", fill=WHITE)
+
+    # Add time labels
+    for hour in (6, 12, 18):
+        label = f"{hour:02d}:00"
+        text_width, _ = draw.textsize(label, font=font)
+        draw.text((width * hour // 24 - (text_width // 2), height_offset), label, font=font, align="left", fill=WHITE)
+
+    return layer
+
+
+def tile_version(ends: numpy.ndarray, colours: numpy.ndarray, row: int) -> int:
+    """A digest of the intervals covering a row of a status log, which changes whenever the row's data does.
+
+    Transitions logged late, such as those replayed from the spool after an outage, are drawn rather
+    than hidden behind a tile of the day as it was first seen.
+    """
+    first, last = numpy.searchsorted(ends, [row * ONE_DAY, (row + 1) * ONE_DAY], side="right")
+    covering = slice(first, last + 1)
+
+    # Ends are taken from the start of the row, so the same day gives the same digest in any image
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(numpy.round((ends[covering] - row * ONE_DAY) * 1000).astype(numpy.int64).tobytes())
+    digest.update(colours[covering].tobytes())
+    return int.from_bytes(digest.digest(), "little")
+
+
 def draw_status_log(
     status_log: list[LogEntry],
     *,
@@ -223,147 +419,203 @@ def draw_status_log(
     show_labels: bool = False,
     num_days: int = 30,
     square: bool = True,
+    user_id: Optional[int] = None,
 ) -> BytesIO:
+    """Draw a status log, one row per day.
+
+    If a user ID is passed the rows of days which are over are cached by the intervals
+    covering them, so only the days which have not been drawn before or whose data has
+    changed since are rasterized.
+    """
 
     row_count = 1 + num_days + show_labels
-    image, draw = base_image(IMAGE_SIZE * row_count, 1)
 
-    # Set consts
-    day_width = IMAGE_SIZE / (60 * 60 * 24)
+    # Set consts, sizes are in full resolution pixels and scaled down to the final image
     if square:
         day_height = IMAGE_SIZE // row_count
     else:
         day_height = IMAGE_SIZE // 31 + show_labels
 
-    image_height = round(day_height * row_count)
+    width = IMAGE_SIZE // DOWNSAMPLE
+    height = round(day_height * row_count) // DOWNSAMPLE
+    row_height = day_height / DOWNSAMPLE
 
     now = datetime.datetime.now(timezone)
     time_offset = now.utcoffset().total_seconds()
-    total_duration = 0.0
 
     if show_labels:
-        time_offset += 60 * 60 * 24
+        time_offset += ONE_DAY
 
-    # Draw status log entries
-    for status, timestamp, timespan in status_log:
-        duration: float = timespan.total_seconds()
-        total_duration += duration
-        new_time_offset = time_offset + duration
+    # Rasterize status log entries directly at the final resolution
+    durations = numpy.array([entry.duration.total_seconds() for entry in status_log], dtype=numpy.float64)
+    colours = numpy.array([get_colour(entry.status, entry.start) for entry in status_log], dtype=numpy.uint8)
+    total_duration = float(durations.sum())
 
-        start_x = round(time_offset * day_width)
-        end_x = round(new_time_offset * day_width)
-        draw.rectangle(((start_x, 0), (end_x, 1)), fill=get_colour(status, timestamp))
+    ends = time_offset + numpy.cumsum(durations)
+    colours = colours.reshape(-1, 4)
 
-        time_offset = new_time_offset
+    # Rows start at midnight in the image's timezone, a row only depends on the entries
+    # within it once the log covers all of it and its day is over
+    origin = status_log[0].start - datetime.timedelta(seconds=time_offset)
+    data_start = next((entry.start for entry in status_log if entry.status is not None), now)
+    settled = now - TILE_SETTLE_TIME
 
-    # Reshape Image
-    pixels = numpy.array(image)
-    # pixels = pixels[:, IMAGE_SIZE:]
-    pixels = pixels.reshape(row_count, IMAGE_SIZE, 4)
-    pixels = pixels.repeat(day_height, 0)
-    image = Image.fromarray(pixels, "RGBA")
+    rows = numpy.empty((row_count, width, 4), dtype=numpy.uint8)
+    for row in range(row_count):
+        row_start = origin + datetime.timedelta(days=row)
+        key = None
+        if user_id is not None and data_start <= row_start and row_start + datetime.timedelta(days=1) <= settled:
+            key = (user_id, int(row_start.timestamp()), width, tile_version(ends, colours, row))
 
-    if show_labels:
-        overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
+        tile = TILE_CACHE.get(key, rows[row].shape) if key is not None else None
+        if tile is None:
+            tile = rasterize_timeline(
+                ends, colours, start=time_offset, rows=1, width=width, row_seconds=ONE_DAY, first_row=row
+            )[0]
+            if key is not None:
+                TILE_CACHE.put(key, tile)
 
-        # Set offsets based on font size
-        font = ImageFont.truetype("res/roboto-bold.ttf", IMAGE_SIZE // int(1.66 * (num_days if square else 30)))
-        text_half_width, text_height = draw.textsize("ｱ" * 2, font=font)
-        height_offset = (day_height - text_height) // 2
+        rows[row] = tile
 
-        x_offset = text_half_width
-        y_offset = day_height
+    image = Image.fromarray(expand_rows(rows, row_height, height), "RGBA")
 
-        time = start_of_day(now)
-        date = now - datetime.timedelta(seconds=total_duration)
+    if show_labels:
+        overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
 
         # Add weekend signifiers
-        for _ in range(int(total_duration // ONE_DAY) + 2):  # 2 because of timezone offset woes
+        date = now - datetime.timedelta(seconds=total_duration)
+        for day in range(1, int(total_duration // ONE_DAY) + 3):  # 2 because of timezone offset woes
 
             if date.weekday() == 5:
                 draw.rectangle(
-                    (0, y_offset, IMAGE_SIZE, y_offset + (2 * day_height)),
+                    (0, round(day * row_height), width, round((day + 2) * row_height)),
                     fill=TRANSLUCENT,
                 )
 
-            y_offset += day_height
             date += datetime.timedelta(days=1)
 
-        y_offset = day_height
-        date = now - datetime.timedelta(seconds=total_duration)
+        image = Image.alpha_composite(image, overlay)
 
-        # Add timezone label
-        draw.text(
-            (x_offset, height_offset),
-            utc_offset(timezone),
-            font=font,
-            align="left",
-            fill="WHITE",
-        )
-
-        # Add hour lines
-        for i in range(1, 24):
-            x_offset = ONE_HOUR * i
-            colour = WHITE if not i % 6 else OPAQUE
-            draw.line(
-                (x_offset, day_height, x_offset, image_height),
-                fill=colour,
-                width=DOWNSAMPLE * 4,
-            )
+        # Add hour lines, timezone and time labels
+        font_size = IMAGE_SIZE // int(1.66 * (num_days if square else 30)) // DOWNSAMPLE
+        image = Image.alpha_composite(image, label_layer(width, height, row_height, font_size, utc_offset(timezone)))
 
-        image = Image.alpha_composite(image, overlay)
         draw = ImageDraw.Draw(image)
-
-        # Add time labels
-        for x_offset in (ONE_HOUR * 6, ONE_HOUR * 12, ONE_HOUR * 18):
-            time += datetime.timedelta(hours=6)
-            text_width, _ = draw.textsize(time.strftime("%H:00"), font=font)
-            draw.text(
-                (x_offset - (text_width // 2), height_offset),
-                time.strftime("%H:00"),
-                font=font,
-                align="left",
-                fill=WHITE,
-            )
+        font = get_font("res/roboto-bold.ttf", font_size)
+        text_half_width, text_height = draw.textsize("ｱ" * 2, font=font)
+        height_offset = (row_height - text_height) // 2
 
         # Add date labels
-        x_offset = text_half_width
-        for _ in range(int(total_duration // ONE_DAY) + 2):  # 2 because of timezone offset woes
-
-            _, text_height = draw.textsize(date.strftime("%b. %d"), font=font)
+        date = now - datetime.timedelta(seconds=total_duration)
+        for day in range(1, int(total_duration // ONE_DAY) + 3):  # 2 because of timezone offset woes
             draw.text(
-                (x_offset, y_offset + height_offset),
+                (text_half_width, round(day * row_height) + height_offset),
                 date.strftime("%b. %d"),
                 font=font,
                 align="left",
                 fill=WHITE,
             )
-            y_offset += day_height
             date += datetime.timedelta(days=1)
 
-    return as_bytes(resample(image))
+    return as_bytes(image)
+
+
+def draw_status_compare(
+    status_logs: list[tuple[str, list[LogEntry]]],
+    *,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    show_labels: bool = True,
+) -> BytesIO:
+    """Draw the status logs of several users over the same period, one row per user."""
+    width = IMAGE_SIZE // DOWNSAMPLE
+    row_height = COMPARE_ROW_HEIGHT
+    height = row_height * (len(status_logs) + show_labels)
+    period = (end - start).total_seconds()
+
+    # Every row is padded to cover the whole period, so the rows can be rasterized as one timeline
+    statuses: list[Optional[Status]] = []
+    starts: list[numpy.ndarray] = []
+    ends: list[numpy.ndarray] = []
+    for row, (_, status_log) in enumerate(status_logs):
+        row_starts = numpy.array([entry.start.timestamp() for entry in status_log], dtype=numpy.float64)
+        row_ends = row_starts + numpy.array([entry.duration.total_seconds() for entry in status_log])
+        first = row_starts[0] if len(row_starts) else end.timestamp()
+
+        statuses += [None, *(entry.status for entry in status_log), None]
+        starts.append(numpy.concatenate(([start.timestamp()], row_starts, [end.timestamp()])))
+        row_ends = numpy.concatenate(([first], row_ends, [end.timestamp()]))
+        ends.append(numpy.clip(row_ends - start.timestamp(), 0, period) + period * row)
+
+    rows = rasterize_timeline(
+        numpy.concatenate(ends),
+        get_colours(statuses, numpy.concatenate(starts)),
+        start=0,
+        rows=len(status_logs),
+        width=width,
+        row_seconds=period,
+    )
+    timeline = expand_rows(rows, row_height, row_height * len(status_logs))
+
+    image = Image.new("RGBA", (width, height), TRANSPARENT)
+    image.paste(Image.fromarray(timeline, "RGBA"), (0, row_height * show_labels))
+
+    if show_labels:
+        draw = ImageDraw.Draw(image)
+        font = get_font("res/roboto-bold.ttf", row_height // 3)
+        text_half_width, text_height = draw.textsize("ｱ" * 2, font=font)
+        height_offset = (row_height - text_height) // 2
+
+        # Add day lines and date labels, skipping labels if there are too many days to fit
+        days = round(period / ONE_DAY)
+        label_every = -(-days // MAX_COMPARE_DATE_LABELS)
+        for day in range(1, days + 1):
+            date = start + datetime.timedelta(days=day)
+            x_offset = round((date - start).total_seconds() / period * width)
+            draw.line((x_offset, row_height, x_offset, height), fill=OPAQUE, width=2)
+            if not day % label_every and day < days:
+                label = date.strftime("%b. %d")
+                text_width, _ = draw.textsize(label, font=font)
+                draw.text((x_offset - text_width // 2, height_offset), label, font=font, fill=WHITE)
 
+        # Add user names
+        for row, (name, _) in enumerate(status_logs, 1):
+            draw.text((text_half_width, row * row_height + height_offset), name, font=font, fill=WHITE)
 
-def generate_status_calendar(status_log: list[LogEntry]) -> StringIO:
-    calendar = Calendar()
+    return as_bytes(image)
 
-    for status, start, duration in status_log:
-        event = Event()
-        event.name = f"User was {status}"
-        event.begin = start.strftime("%Y-%m-%d %H:%M:%S")
-        event.end = (start + duration).strftime("%Y-%m-%d %H:%M:%S")
-        calendar.events.add(event)
 
-    out = StringIO()
-    out.writelines(calendar)
-    out.seek(0)
-    return out
+def preload() -> None:
+    """Load the status image fonts, run once in each render worker."""
+    get_font("res/roboto-bold.ttf", IMAGE_SIZE // 20)
 
 
 class StatusLogging(Cog):
     def __init__(self, bot: BotBase):
         self.bot = bot
+        self._render_cache = RenderCache(ttl=CONFIG.RENDER_CACHE_TTL, max_bytes=CONFIG.RENDER_CACHE_MAX_BYTES)
+
+        metrics = getattr(bot, "_log_metrics", None)
+        if metrics is not None:
+            for name, kind, description in RENDER_METRICS:
+                metrics.describe(name, kind, description)
+
+    def _is_migrating(self) -> bool:
+        # While the status log is being copied into partitions it is incomplete, so nothing drawn from it is cached
+        return "status" in getattr(self.bot, "_log_migrating", ())
+
+    def _record_render_metrics(self) -> None:
+        metrics = getattr(self.bot, "_log_metrics", None)
+        if metrics is None:
+            return
+
+        cache = self._render_cache
+        for kind in cache.hits.keys() | cache.misses.keys():
+            metrics.set_total("logging_render_cache_hits_total", cache.hits[kind], kind=kind)
+            metrics.set_total("logging_render_cache_misses_total", cache.misses[kind], kind=kind)
+        metrics.set_total("logging_render_cache_evictions_total", cache.evicted)
+        metrics.set("logging_render_cache_bytes", cache.bytes)
 
     @commands.command(name="status_pie", aliases=["sp"])
     async def status_pie(
@@ -386,20 +638,47 @@ class StatusLogging(Cog):
         async with ctx.typing():
             async with ctx.db as connection:
                 await OptInStatus.is_public(connection, ctx, user)
-                data = await get_status_totals(connection, user, days=flags.num_days)
-
-                if not data:
-                    raise commands.BadArgument(
-                        f'User "{user}" currently has no status log data, please try again later.'
-                    )
 
-            avatar_fp = BytesIO()
-            await user.avatar.replace(format="png", size=IMAGE_SIZE // 2).save(avatar_fp)
-
-            draw_call = partial(draw_status_pie, data, avatar_fp, show_totals=flags.show_totals)
-            image = await self.bot.loop.run_in_executor(None, draw_call)
+                # A render is reused until a new transition is logged
+                latest = await StatusLog.get_latest(connection, user.id)
+                key = (
+                    user.id,
+                    flags.num_days,
+                    flags.show_totals,
+                    user.display_avatar.key,
+                    latest,
+                    ctx.message.created_at.date(),
+                )
+                image = self._render_cache.get("status_pie", key)
+
+                if image is None:
+                    data = await get_status_totals(connection, user, days=flags.num_days)
+
+                    if not data:
+                        raise commands.BadArgument(
+                            f'User "{user}" currently has no status log data, please try again later.'
+                        )
+
+            if image is None:
+                # The avatar is only downloaded if the render workers don't already have it cached
+                avatar_fp = None
+                if not AVATAR_CACHE.has(user.display_avatar.key, avatar_size(flags.show_totals)):
+                    avatar_fp = BytesIO()
+                    await user.display_avatar.replace(format="png", size=IMAGE_SIZE // 2).save(avatar_fp)
+
+                image_fp = await self.bot._render_service.render(  # type: ignore
+                    ctx.author.id,
+                    draw_status_pie,
+                    data,
+                    avatar_fp,
+                    show_totals=flags.show_totals,
+                    avatar_key=user.display_avatar.key,
+                )
+                image = image_fp.getvalue()
+                self._render_cache.put("status_pie", key, image)
 
-            await ctx.send(file=discord.File(image, f"{user.id}_status_{ctx.message.created_at}.png"))
+            self._record_render_metrics()
+            await ctx.send(file=discord.File(BytesIO(image), f"{user.id}_status_{ctx.message.created_at}.png"))
 
     @commands.group(name="status_log", aliases=["sl", "sc"], invoke_without_command=True)
     async def status_log(
@@ -437,42 +716,121 @@ class StatusLogging(Cog):
 
             async with ctx.typing():
                 await OptInStatus.is_public(connection, ctx, user)
-                data = await get_status_log(connection, user, days=flags.num_days)
 
-                if not data:
-                    raise commands.BadArgument(
-                        f'User "{user}" currently has no status log data, please try again later.'
-                    )
+                # A render is reused until a new transition is logged
+                latest = await StatusLog.get_latest(connection, user.id)
+                key = (
+                    user.id,
+                    flags.num_days,
+                    sql_timezone(timezone),
+                    flags.show_labels,
+                    flags._square,
+                    latest,
+                    ctx.message.created_at.date(),
+                )
+                cache = not self._is_migrating()
+                image = self._render_cache.get("status_log", key) if cache else None
+
+                if image is None:
+                    data = await get_status_log(connection, user, days=flags.num_days, timezone=timezone)
+
+                    if not data:
+                        raise commands.BadArgument(
+                            f'User "{user}" currently has no status log data, please try again later.'
+                        )
+
+            if image is None:
+                delta = (ctx.message.created_at - data[0].start).days
+                days = max(min(flags.num_days, delta), MIN_DAYS)
+
+                image_fp = await self.bot._render_service.render(  # type: ignore
+                    ctx.author.id,
+                    draw_status_log,
+                    data,
+                    timezone=timezone,
+                    show_labels=flags.show_labels,
+                    num_days=days,
+                    square=flags._square,
+                    user_id=user.id if cache else None,
+                )
+                image = image_fp.getvalue()
+                if cache:
+                    self._render_cache.put("status_log", key, image)
 
-            delta = (ctx.message.created_at - data[0].start).days
-            days = max(min(flags.num_days, delta), MIN_DAYS)
+            self._record_render_metrics()
+            await ctx.send(file=discord.File(BytesIO(image), f"{user.id}_status_{ctx.message.created_at}.png"))
 
-            draw_call = partial(
-                draw_status_log,
-                data,
-                timezone=timezone,
+    @commands.command(name="status_compare", aliases=["scmp"])
+    async def status_compare(
+        self,
+        ctx: Context,
+        users: commands.Greedy[discord.User],
+        *,
+        flags: StatusCompareOptions,
+    ):
+        """Compare the status logs of several users.
+
+        `users`: The users who's status logs to compare, you are always included.
+        `--labels`: Sets whether date labels and names should be shown, defaults to True.
+        `--days`: The number of days to compare. Defaults to 7.
+        """
+        users = list(dict.fromkeys([ctx.author, *users]))  # type: ignore
+
+        if len(users) < 2:
+            raise commands.BadArgument("You need to specify at least one other user.")
+
+        if len(users) > MAX_COMPARE_USERS:
+            raise commands.BadArgument(f"You can compare at most {MAX_COMPARE_USERS} users.")
+
+        if flags.num_days < 1:
+            raise commands.BadArgument("You must compare at least 1 day.")
+
+        async with ctx.typing():
+            async with ctx.db as connection:
+                await OptInStatus.are_public(connection, ctx, users)
+                since, status_logs = await get_status_intervals_many(connection, users, days=flags.num_days)
+
+            if not any(status_logs.values()):
+                raise commands.BadArgument(
+                    "None of those users currently have status log data, please try again later."
+                )
+
+            image = await self.bot._render_service.render(  # type: ignore
+                ctx.author.id,
+                draw_status_compare,
+                [(str(user), status_logs[user.id]) for user in users],
+                start=since,
+                end=discord.utils.utcnow(),
                 show_labels=flags.show_labels,
-                num_days=days,
-                square=flags._square,
             )
-            image = await self.bot.loop.run_in_executor(None, draw_call)
 
-            await ctx.send(file=discord.File(image, f"{user.id}_status_{ctx.message.created_at}.png"))
+            await ctx.send(file=discord.File(image, f"status_compare_{ctx.message.created_at}.png"))
 
     @status_log.command(name="calendar", aliases=["cal"])
-    async def status_log_calendar(self, ctx: Context, user: Optional[discord.User] = None):
-        """Output an `ical` format status log"""
+    async def status_log_calendar(self, ctx: Context, user: Optional[discord.User] = None, days: int = 30):
+        """Output an `ical` format status log.
+
+        `user`: The user who's status log to export, defaults to you.
+        `days`: The number of days to export, up to a year. Defaults to 30.
+        """
         user = cast(discord.User, user or ctx.author)
 
-        async with ctx.db as connection:
-            await OptInStatus.is_public(connection, ctx, user)
-            data = await get_status_log(connection, user, days=30)
+        if not MIN_DAYS <= days <= MAX_CALENDAR_DAYS:
+            raise commands.BadArgument(f"You can export between {MIN_DAYS} and {MAX_CALENDAR_DAYS} days.")
+
+        calendar = BytesIO()
+        async with ctx.typing():
+            async with ctx.db as connection:
+                await OptInStatus.is_public(connection, ctx, user)
+                events = await write_calendar(
+                    calendar, user.id, merge_intervals(iter_status_intervals(connection, user, days=days))
+                )
 
-            if not data:
-                raise commands.BadArgument(f'User "{user}" currently has no status log data, please try again later.')
+        if not events:
+            raise commands.BadArgument(f'User "{user}" currently has no status log data, please try again later.')
 
-        calendar = generate_status_calendar(data)
-        await ctx.send(file=discord.File(calendar, f"{user.id}_status_{ctx.message.created_at}.ical"))
+        calendar.seek(0)
+        await ctx.send(file=discord.File(calendar, f"{user.id}_status_{ctx.message.created_at}.ics"))
 
 
 def setup(bot: BotBase):
@@ -0,0 +1,124 @@
+import os
+
+from collections import OrderedDict
+from typing import Optional
+
+import numpy
+
+
+TileKey = tuple[int, int, int, int]
+
+
+class TileCache:
+    """Rows of pixels for days which are over, keyed by a version of the data they were drawn from.
+
+    Tiles are kept in memory and evicted least recently used first once they pass
+    `max_bytes`. If a spill path is set evicted tiles are written to disk, where they
+    are shared between processes, and the oldest files are removed once the directory
+    passes `max_spill_bytes`.
+    """
+
+    def __init__(self, *, max_bytes: int, spill_path: Optional[str] = None, max_spill_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self.max_spill_bytes = max_spill_bytes
+        self.bytes = 0
+        self._tiles: OrderedDict[TileKey, numpy.ndarray] = OrderedDict()
+        self._spill_bytes: Optional[int] = None
+
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def _spill_file(self, key: TileKey) -> str:
+        return os.path.join(self.spill_path, "{}_{}_{}_{:016x}.tile".format(*key))  # type: ignore
+
+    def get(self, key: TileKey, shape: tuple[int, ...]) -> Optional[numpy.ndarray]:
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+        if self.spill_path is not None:
+            try:
+                with open(self._spill_file(key), "rb") as fp:
+                    tile = numpy.frombuffer(fp.read(), dtype=numpy.uint8).reshape(shape)
+            except (OSError, ValueError):
+                pass
+            else:
+                self.spill_hits += 1
+                self._add(key, tile)
+                return tile
+
+        self.misses += 1
+        return None
+
+    def put(self, key: TileKey, tile: numpy.ndarray) -> None:
+        tile = tile.copy()
+        tile.flags.writeable = False
+        self._add(key, tile)
+
+    def _add(self, key: TileKey, tile: numpy.ndarray) -> None:
+        if key in self._tiles:
+            self.bytes -= self._tiles.pop(key).nbytes
+
+        self._tiles[key] = tile
+        self.bytes += tile.nbytes
+
+        while self.bytes > self.max_bytes:
+            evicted_key, evicted = self._tiles.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self._spill(evicted_key, evicted)
+
+    def _spill(self, key: TileKey, tile: numpy.ndarray) -> None:
+        if self.spill_path is None:
+            return
+
+        path = self._spill_file(key)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(self.spill_path, exist_ok=True)
+
+        # Written then renamed as other processes read the same directory
+        with open(f"{path}.{os.getpid()}.tmp", "wb") as fp:
+            fp.write(tile.tobytes())
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+        if self._spill_bytes is None:
+            self._spill_bytes = self._prune()
+        self._spill_bytes += tile.nbytes
+        if self._spill_bytes > self.max_spill_bytes:
+            self._spill_bytes = self._prune()
+
+    def _prune(self) -> int:
+        """Remove the oldest spilled tiles until the directory is back under three quarters of its limit.
+
+        Returns the size of the remaining tiles.
+        """
+        entries = []
+        with os.scandir(self.spill_path) as it:  # type: ignore
+            for entry in it:
+                if entry.name.endswith(".tile"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_spill_bytes:
+            return total
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_spill_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        return total
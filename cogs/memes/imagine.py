@@ -1,4 +1,5 @@
 import io
+from functools import lru_cache
 from typing import cast
 
 from PIL import Image, ImageDraw, ImageFont
@@ -29,6 +30,29 @@ BYLINE_BOUND = (IMAGE_WIDTH - (BYLINE_OFFSET[0] * 2), 192)
 WHITE = (255, 255, 255)
 
 
+@lru_cache(maxsize=512)
+def get_font(font_name: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(font_name, size)
+
+
+@lru_cache(maxsize=1)
+def load_background() -> Image.Image:
+    image = Image.open(IMAGE)
+    image.load()
+    return image
+
+
+def get_background() -> Image.Image:
+    return load_background().copy()
+
+
+def preload() -> None:
+    """Load the background and the starting font sizes, run once in each render worker."""
+    get_background()
+    get_font(TITLE_FONT, 300)
+    get_font(BYLINE_FONT, 100)
+
+
 def draw_text(
     draw: ImageDraw.ImageDraw,
     text: str,
@@ -44,7 +68,7 @@ def draw_text(
 
     # Calculate font size
     while True:
-        font = ImageFont.truetype(font_name, font_size)
+        font = get_font(font_name, font_size)
         text_size = cast(tuple[int, int], draw.textsize(text, font=font, spacing=spacing))
         if text_size[0] < bounds[0] and text_size[1] < bounds[1]:
             break
@@ -66,15 +90,26 @@ def draw_text(
         y_pos += text_size[1] // len(lines)
 
 
+def draw_imagine(title: str, byline: str) -> io.BytesIO:
+    # Load image
+    image = get_background()
+    draw = cast(ImageDraw.ImageDraw, ImageDraw.Draw(image))
+
+    draw_text(draw, title, TITLE_FONT, WHITE, TITLE_BOUND, TITLE_OFFSET, 300, -96)
+    if byline:
+        draw_text(draw, byline, BYLINE_FONT, WHITE, BYLINE_BOUND, BYLINE_OFFSET, 100)
+
+    out_fp = io.BytesIO()
+    image.save(out_fp, "PNG")
+    out_fp.seek(0)
+    return out_fp
+
+
 class Imagine(commands.Cog):
     @commands.command(name="imagine")
     async def timecard(self, ctx, *, text: commands.clean_content(fix_channel_mentions=True) = "a place\nfor friends and communities"):  # type: ignore
         """Imagine."""
         async with ctx.typing():
-            # Load image
-            image = Image.open(IMAGE)
-            draw = cast(ImageDraw.ImageDraw, ImageDraw.Draw(image))
-
             title, _, byline = str(text).upper().partition("\n")
 
             if "\n" in byline:
@@ -83,13 +118,7 @@ class Imagine(commands.Cog):
             title = f"IMAGINE\n{title.strip()}"
             byline = byline.strip()
 
-            draw_text(draw, title, TITLE_FONT, WHITE, TITLE_BOUND, TITLE_OFFSET, 300, -96)
-            if byline:
-                draw_text(draw, byline, BYLINE_FONT, WHITE, BYLINE_BOUND, BYLINE_OFFSET, 100)
-
-            out_fp = io.BytesIO()
-            image.save(out_fp, "PNG")
-            out_fp.seek(0)
+            out_fp = await ctx.bot._render_service.render(ctx.author.id, draw_imagine, title, byline)
 
             await ctx.send(file=discord.File(out_fp, "imagine.png"))
 
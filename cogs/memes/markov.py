@@ -1,9 +1,10 @@
 import datetime
 from functools import partial
 
-from collections.abc import Awaitable
+from collections.abc import Awaitable, Callable
 from typing import cast, Optional, Union
 
+import asyncpg
 import rsmarkov
 
 import discord
@@ -46,16 +47,22 @@ class Markov(Cog):
         )
 
     async def get_model(
-        self, query: tuple[Union[str, int], ...], *coros: Awaitable[list[str]], order: int = 2
+        self,
+        ctx: Context,
+        query: tuple[Union[str, int], ...],
+        *corpora: Callable[[asyncpg.Connection], Awaitable[list[str]]],
+        order: int = 2,
     ) -> rsmarkov.Markov:
         # Return cached model if one exists
         if query in self.model_cache:
             return self.model_cache[query]
 
-        # Generate the model
+        # Generate the model, releasing the connection before training
         data: list[str] = list()
-        for coro in coros:
-            data.extend(await coro)
+        async with ctx.db as connection:
+            for corpus in corpora:
+                data.extend(await corpus(connection))
+
         if not data:
             raise commands.BadArgument("There was not enough message log data, please try again later.")
 
@@ -97,8 +104,8 @@ class Markov(Cog):
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("um", is_nsfw, 2, user.id)
 
-                coro = MessageLog.get_user_log(connection, user, is_nsfw)
-                model = await self.get_model(query, coro, order=2)
+            corpus = partial(MessageLog.get_user_log, user=user, nsfw=is_nsfw)
+            model = await self.get_model(ctx, query, corpus, order=2)
 
             await self.send_markov(ctx, model, 2)
 
@@ -117,8 +124,8 @@ class Markov(Cog):
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("lqum", is_nsfw, 1, user.id)
 
-                coro = MessageLog.get_user_log(connection, user, is_nsfw)
-                model = await self.get_model(query, coro, order=1)
+            corpus = partial(MessageLog.get_user_log, user=user, nsfw=is_nsfw)
+            model = await self.get_model(ctx, query, corpus, order=1)
 
             await self.send_markov(ctx, model, 1)
 
@@ -138,8 +145,8 @@ class Markov(Cog):
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("um", is_nsfw, 2, user.id)
 
-                coro = MessageLog.get_user_log(connection, user, is_nsfw)
-                model = await self.get_model(query, coro, order=2)
+            corpus = partial(MessageLog.get_user_log, user=user, nsfw=is_nsfw)
+            model = await self.get_model(ctx, query, corpus, order=2)
 
             await self.send_markov(ctx, model, 2, seed=seed.lower())
 
@@ -156,18 +163,12 @@ class Markov(Cog):
 
         async with ctx.typing():
             async with ctx.db as connection:
+                await OptInStatus.are_public(connection, ctx, users)
 
-                coros = []
-                for user in users:
-                    if user == ctx.author:
-                        await OptInStatus.is_opted_in(connection, ctx)
-                    else:
-                        await OptInStatus.is_public(connection, ctx, user)
-
-                    coros.append(MessageLog.get_user_log(connection, user, is_nsfw))
+            corpora = [partial(MessageLog.get_user_log, user=user, nsfw=is_nsfw) for user in users]
 
-                query = ("mum", is_nsfw, 3) + tuple(user.id for user in users)
-                model = await self.get_model(query, *coros, order=3)
+            query = ("mum", is_nsfw, 3) + tuple(user.id for user in users)
+            model = await self.get_model(ctx, query, *corpora, order=3)
 
             await self.send_markov(ctx, model, 3)
 
@@ -187,12 +188,11 @@ class Markov(Cog):
     async def guild_markov(self, ctx: Context):
         """Generate a markov chain based off messages in the server."""
         async with ctx.typing():
-            async with ctx.db as connection:
-                is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
-                query = ("gm", is_nsfw, 3, ctx.guild.id)
+            is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
+            query = ("gm", is_nsfw, 3, ctx.guild.id)
 
-                coro = MessageLog.get_guild_log(connection, ctx.guild, is_nsfw)
-                model = await self.get_model(query, coro, order=3)
+            corpus = partial(MessageLog.get_guild_log, guild=ctx.guild, nsfw=is_nsfw)
+            model = await self.get_model(ctx, query, corpus, order=3)
 
             await self.send_markov(ctx, model, 3)
 
@@ -201,12 +201,11 @@ class Markov(Cog):
     async def code_guild_markov(self, ctx: Context):
         """Generate a markov chain code block."""
         async with ctx.typing():
-            async with ctx.db as connection:
-                is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
-                query = ("cgm", is_nsfw, 2, ctx.guild.id)
+            is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
+            query = ("cgm", is_nsfw, 2, ctx.guild.id)
 
-                coro = MessageLog.get_guild_log(connection, ctx.guild, is_nsfw)
-                model = await self.get_model(query, coro, order=2)
+            corpus = partial(MessageLog.get_guild_log, guild=ctx.guild, nsfw=is_nsfw)
+            model = await self.get_model(ctx, query, corpus, order=2)
 
             await self.send_markov(ctx, model, 2, callable=make_code)
 
@@ -222,8 +221,8 @@ class Markov(Cog):
                 is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
                 query = ("cum", is_nsfw, 2, user.id)
 
-                coro = MessageLog.get_user_log(connection, user, is_nsfw)
-                model = await self.get_model(query, coro, order=2)
+            corpus = partial(MessageLog.get_user_log, user=user, nsfw=is_nsfw)
+            model = await self.get_model(ctx, query, corpus, order=2)
 
             await self.send_markov(ctx, model, 2, callable=make_code)
 
@@ -234,12 +233,11 @@ class Markov(Cog):
         `seed`: The string to attempt to seed the markov chain with.
         """
         async with ctx.typing():
-            async with ctx.db as connection:
-                is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
-                query = ("gm", is_nsfw, 3, ctx.guild.id)
+            is_nsfw = ctx.channel.is_nsfw() if ctx.guild is not None else False
+            query = ("gm", is_nsfw, 3, ctx.guild.id)
 
-                coro = MessageLog.get_guild_log(connection, ctx.guild, is_nsfw, False)
-                model = await self.get_model(query, coro, order=3)
+            corpus = partial(MessageLog.get_guild_log, guild=ctx.guild, nsfw=is_nsfw, flatten_case=False)
+            model = await self.get_model(ctx, query, corpus, order=3)
 
             await self.send_markov(ctx, model, 3, seed=seed.lower())
 
@@ -1,6 +1,7 @@
 import io
 import random
 
+from functools import lru_cache
 from typing import NamedTuple, Optional
 
 from PIL import Image, ImageDraw, ImageFont
@@ -108,60 +109,87 @@ TIMECARDS = [
 ]
 
 
-class TimeCard(commands.Cog):
-    """Spongebob Squarepants timecard."""
+@lru_cache(maxsize=128)
+def get_font(size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(FONT, size)
 
-    @commands.command(name="timecard", aliases=["tc"])
-    async def timecard(self, ctx, *, text: commands.clean_content(fix_channel_mentions=True)):  # type: ignore
-        """Generate's a Spongebob Squarepants timecard image.
 
-        `text`: The text to show on the timecard.
-        """
-        async with ctx.typing():
-            timecard: Timecard = random.choice(TIMECARDS)
+@lru_cache(maxsize=None)
+def load_background(filename: str) -> Image.Image:
+    image = Image.open(f"{IMAGES}/timecard_{filename}.png")
+    image.load()
+    return image
+
+
+def get_background(timecard: Timecard) -> Image.Image:
+    return load_background(timecard.filename).copy()
+
+
+def preload() -> None:
+    """Load every timecard background and the starting font size, run once in each render worker."""
+    for timecard in TIMECARDS:
+        get_background(timecard)
+    get_font(100)
+
 
-            # Load image
-            image = Image.open(f"{IMAGES}/timecard_{timecard.filename}.png")
-            draw = ImageDraw.Draw(image)
+def draw_timecard(text: str, timecard: Timecard) -> io.BytesIO:
+    # Load image
+    image = get_background(timecard)
+    draw = ImageDraw.Draw(image)
 
-            # Setup font
-            font_size = 100
-            font = ImageFont.truetype(FONT, font_size)
+    # Setup font
+    font_size = 100
+    font = get_font(font_size)
 
-            # Calculate font-size
-            while (text_size := draw.textsize(text, font=font)) > (
-                TIMECARD_X_BOUND,
-                TIMECARD_Y_BOUND,
-            ):
-                font_size -= 1
-                font = ImageFont.truetype(FONT, font_size)
+    # Calculate font-size
+    while (text_size := draw.textsize(text, font=font)) > (
+        TIMECARD_X_BOUND,
+        TIMECARD_Y_BOUND,
+    ):
+        font_size -= 1
+        font = get_font(font_size)
 
-            # Calculate Starting Y position
-            y_pos = TIMECARD_Y_OFFSET + (TIMECARD_Y_BOUND - text_size[1]) // 2
+    # Calculate Starting Y position
+    y_pos = TIMECARD_Y_OFFSET + (TIMECARD_Y_BOUND - text_size[1]) // 2
 
-            # Draw text
-            lines = text.split("\n")
-            for line in lines:
+    # Draw text
+    lines = text.split("\n")
+    for line in lines:
 
-                line_width, _ = draw.textsize(line, font=font)
-                x_pos = TIMECARD_X_OFFSET + (TIMECARD_X_BOUND - line_width) // 2
+        line_width, _ = draw.textsize(line, font=font)
+        x_pos = TIMECARD_X_OFFSET + (TIMECARD_X_BOUND - line_width) // 2
 
-                if timecard.shadow_colour is not None:
-                    shadow_offset = int(font_size ** 0.5 / 2) + 1
-                    draw.text(
-                        (x_pos - shadow_offset, y_pos - shadow_offset),
-                        line,
-                        timecard.shadow_colour,
-                        font=font,
-                    )
+        if timecard.shadow_colour is not None:
+            shadow_offset = int(font_size ** 0.5 / 2) + 1
+            draw.text(
+                (x_pos - shadow_offset, y_pos - shadow_offset),
+                line,
+                timecard.shadow_colour,
+                font=font,
+            )
 
-                draw.text((x_pos, y_pos), line, timecard.colour, font=font)
+        draw.text((x_pos, y_pos), line, timecard.colour, font=font)
 
-                y_pos += text_size[1] // len(lines)
+        y_pos += text_size[1] // len(lines)
 
-            out_fp = io.BytesIO()
-            image.save(out_fp, "PNG")
-            out_fp.seek(0)
+    out_fp = io.BytesIO()
+    image.save(out_fp, "PNG")
+    out_fp.seek(0)
+    return out_fp
+
+
+class TimeCard(commands.Cog):
+    """Spongebob Squarepants timecard."""
+
+    @commands.command(name="timecard", aliases=["tc"])
+    async def timecard(self, ctx, *, text: commands.clean_content(fix_channel_mentions=True)):  # type: ignore
+        """Generate's a Spongebob Squarepants timecard image.
+
+        `text`: The text to show on the timecard.
+        """
+        async with ctx.typing():
+            timecard: Timecard = random.choice(TIMECARDS)
+            out_fp = await ctx.bot._render_service.render(ctx.author.id, draw_timecard, str(text), timecard)
 
             await ctx.send(file=discord.File(out_fp, "timecard.png"))
 
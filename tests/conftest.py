@@ -0,0 +1,11 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock which only moves when a test advances it."""
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
@@ -0,0 +1,60 @@
+import os
+
+from typing import NamedTuple
+
+from cogs.logging.buffer import BufferManager, FlushPolicy
+from cogs.logging.columnar import ColumnarBatch
+
+
+class Entry(NamedTuple):
+    id: int
+    content: str
+
+
+def make_manager(path):
+    policy = FlushPolicy(
+        max_rows=100,
+        max_bytes=1 << 20,
+        max_age=60,
+        min_interval=1,
+        batch_rows=100,
+        max_total_bytes=1 << 20,
+        overflow="spill",
+        spill_path=str(path / "spill.pickle"),
+    )
+    return BufferManager(policy, ("entry", Entry))
+
+
+def spill(manager, *ids):
+    manager._append_spill({"entry": ColumnarBatch(Entry, [Entry(id, str(id)) for id in ids])})
+
+
+def drained(manager):
+    return [entry[0] for batch in manager.drain() for entry in batch["entry"]]
+
+
+def test_interrupted_drain_is_recovered(tmp_path):
+    manager = make_manager(tmp_path)
+    spill(manager, 1, 2, 3)
+
+    # The process stops after the spill file was moved aside for draining, then spills more
+    os.replace(manager.policy.spill_path, f"{manager.policy.spill_path}.draining")
+    spill(manager, 4, 5)
+
+    manager = make_manager(tmp_path)
+    assert not os.path.exists(f"{manager.policy.spill_path}.draining")
+    assert drained(manager) == [1, 2, 3, 4, 5]
+    assert not manager.has_spill
+
+
+def test_closed_drain_keeps_the_rest(tmp_path):
+    manager = make_manager(tmp_path)
+    spill(manager, 1, 2, 3)
+
+    batches = manager.drain()
+    batch = next(batches)
+    assert [entry[0] for entry in batch["entry"]] == [1, 2, 3]
+    batches.close()
+
+    assert not os.path.exists(f"{manager.policy.spill_path}.draining")
+    assert drained(make_manager(tmp_path)) == [1, 2, 3]
@@ -0,0 +1,79 @@
+import datetime
+import enum
+
+from typing import NamedTuple
+
+from cogs.logging.columnar import Bitset, ColumnarBatch, StringArena
+
+
+class Colour(enum.Enum):
+    red = "red"
+    green = "green"
+
+    @classmethod
+    def try_value(cls, value):
+        return cls(value)
+
+
+class Entry(NamedTuple):
+    id: int
+    content: str
+    flag: bool
+    timestamp: datetime.datetime
+    colour: Colour
+
+
+UTC = datetime.timezone.utc
+
+ENTRIES = [
+    Entry(1 << 62, "hello world", True, datetime.datetime(2021, 5, 1, 12, 30, 15, 123456, UTC), Colour.red),
+    Entry(-5, "", False, datetime.datetime(1999, 12, 31, 23, 59, 59, tzinfo=UTC), Colour.green),
+    Entry(0, "ünïcödé \U0001f600 \ud800", True, datetime.datetime(2021, 1, 1, tzinfo=UTC), Colour.green),
+]
+
+
+def test_round_trip():
+    batch = ColumnarBatch(Entry, ENTRIES)
+    assert len(batch) == len(ENTRIES)
+    assert list(batch) == [tuple(entry) for entry in ENTRIES]
+
+
+def test_naive_datetimes_are_utc():
+    naive = datetime.datetime(2021, 5, 1, 12, 30)
+    batch = ColumnarBatch(Entry, [Entry(1, "a", False, naive, Colour.red)])
+    assert batch.column("timestamp")[0] == naive.replace(tzinfo=UTC)
+
+
+def test_concatenation_keeps_order():
+    first = ColumnarBatch(Entry, ENTRIES[:1])
+    second = ColumnarBatch(Entry, ENTRIES[1:])
+    assert list(first + second) == [tuple(entry) for entry in ENTRIES]
+    # Neither operand is modified
+    assert len(first) == 1 and len(second) == 2
+
+
+def test_empty_batch():
+    batch = ColumnarBatch(Entry)
+    assert len(batch) == 0
+    assert not batch
+    assert list(batch) == []
+
+
+def test_sql_rows_use_enum_names():
+    batch = ColumnarBatch(Entry, ENTRIES)
+    assert [row[4] for row in batch.sql_rows()] == ["red", "green", "green"]
+    assert list(batch.sql_columns()[0]) == [entry.id for entry in ENTRIES]
+
+
+def test_bitset_across_bytes():
+    values = [i % 3 == 0 for i in range(21)]
+    bits = Bitset(values)
+    assert list(bits) == values
+    assert [bits[i] for i in range(len(values))] == values
+    assert bits.nbytes == 3
+
+
+def test_string_arena_indexing():
+    arena = StringArena(["a", "", "bcd"])
+    assert [arena[i] for i in range(3)] == ["a", "", "bcd"]
+    assert list(arena + StringArena(["e"])) == ["a", "", "bcd", "e"]
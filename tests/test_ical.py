@@ -0,0 +1,113 @@
+import asyncio
+import datetime
+import io
+
+import pytest
+
+# The logging package needs discord.py, which isn't installed everywhere the tests run
+pytest.importorskip("discord")
+
+from cogs.logging.db import Status
+from cogs.logging.ical import fold, merge_intervals, write_calendar
+
+
+START = datetime.datetime(2021, 5, 1, tzinfo=datetime.timezone.utc)
+
+
+def minutes(n):
+    return datetime.timedelta(minutes=n)
+
+
+def merge(intervals):
+    async def source():
+        for interval in intervals:
+            yield interval
+
+    async def collect():
+        return [interval async for interval in merge_intervals(source())]
+
+    return asyncio.run(collect())
+
+
+def physical_lines(folded):
+    assert folded.endswith("\r\n")
+    return folded[:-2].split("\r\n")
+
+
+def unfold(folded):
+    return folded[:-2].replace("\r\n ", "")
+
+
+def test_short_lines_are_not_folded():
+    line = "SUMMARY:" + "x" * 67
+    assert len(line) == 75
+    assert fold(line) == line + "\r\n"
+
+
+def test_long_lines_fold_at_75_octets():
+    line = "SUMMARY:" + "x" * 200
+    lines = physical_lines(fold(line))
+
+    assert len(lines[0].encode()) == 75
+    assert all(line.startswith(" ") for line in lines[1:])
+    assert all(len(line.encode()) <= 75 for line in lines)
+    assert unfold(fold(line)) == line
+
+
+def test_multibyte_characters_are_not_split():
+    line = "SUMMARY:" + "é" * 100
+    lines = physical_lines(fold(line))
+
+    assert all(len(line.encode()) <= 75 for line in lines)
+    assert unfold(fold(line)) == line
+
+
+def test_same_status_intervals_merge():
+    intervals = [
+        (Status.online, START, minutes(10)),
+        (Status.online, START + minutes(10), minutes(5)),
+        (Status.idle, START + minutes(15), minutes(20)),
+    ]
+    assert merge(intervals) == [
+        (Status.online, START, minutes(15)),
+        (Status.idle, START + minutes(15), minutes(20)),
+    ]
+
+
+def test_short_intervals_are_absorbed():
+    intervals = [
+        (Status.online, START, minutes(10)),
+        (Status.dnd, START + minutes(10), datetime.timedelta(seconds=30)),
+        (Status.online, START + minutes(10) + datetime.timedelta(seconds=30), minutes(5)),
+    ]
+    assert merge(intervals) == [
+        (Status.online, START, minutes(15) + datetime.timedelta(seconds=30)),
+    ]
+
+
+def test_leading_short_interval_is_dropped():
+    intervals = [
+        (Status.dnd, START, datetime.timedelta(seconds=10)),
+        (Status.online, START + datetime.timedelta(seconds=10), minutes(10)),
+    ]
+    assert merge(intervals) == [(Status.online, START + datetime.timedelta(seconds=10), minutes(10))]
+
+
+def test_no_intervals():
+    assert merge([]) == []
+
+
+def test_events_are_stamped_with_the_export_time():
+    async def source():
+        yield (Status.online, START, minutes(10))
+        yield (Status.idle, START + minutes(10), minutes(10))
+
+    fp = io.BytesIO()
+    before = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    assert asyncio.run(write_calendar(fp, 1, source())) == 2
+
+    lines = fp.getvalue().decode().split("\r\n")
+    stamps = {line for line in lines if line.startswith("DTSTAMP:")}
+    assert len(stamps) == 1
+    stamp = datetime.datetime.strptime(stamps.pop(), "DTSTAMP:%Y%m%dT%H%M%SZ").replace(tzinfo=datetime.timezone.utc)
+    assert stamp >= before
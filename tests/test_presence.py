@@ -0,0 +1,64 @@
+import pytest
+
+discord = pytest.importorskip("discord")
+
+from cogs.logging.db import Status
+from cogs.logging.presence import PresenceTracker
+
+
+def test_update_reports_changes(clock):
+    tracker = PresenceTracker(window=2, max_users=10)
+
+    assert tracker.update(1, Status.online, discord.Status.online)
+    assert not tracker.update(1, Status.online, discord.Status.online)
+    assert tracker.update(1, Status.idle, discord.Status.idle)
+    assert tracker.get(1) is Status.idle
+    assert (tracker.changes, tracker.unchanged) == (2, 1)
+
+
+def test_repeats_within_the_window_are_coalesced(clock):
+    tracker = PresenceTracker(window=2, max_users=10)
+    tracker.update(1, Status.idle, discord.Status.idle)
+
+    clock[0] += 1
+    assert tracker.is_repeat(1, discord.Status.idle)
+    assert not tracker.is_repeat(1, discord.Status.dnd)
+    assert not tracker.is_repeat(2, discord.Status.idle)
+
+    clock[0] += 1
+    assert not tracker.is_repeat(1, discord.Status.idle)
+    assert tracker.coalesced == 1
+
+
+def test_unchanged_updates_refresh_the_raw_status(clock):
+    tracker = PresenceTracker(window=2, max_users=10)
+    tracker.update(1, Status.streaming, discord.Status.online)
+
+    # Going dnd while streaming logs nothing, but going back online afterwards isn't a repeat
+    assert not tracker.update(1, Status.streaming, discord.Status.dnd)
+    assert tracker.is_repeat(1, discord.Status.dnd)
+    assert not tracker.is_repeat(1, discord.Status.online)
+    assert tracker.update(1, Status.online, discord.Status.online)
+
+
+def test_least_recently_changed_are_evicted(clock):
+    tracker = PresenceTracker(window=2, max_users=2)
+    tracker.update(1, Status.online, discord.Status.online)
+    tracker.update(2, Status.online, discord.Status.online)
+    tracker.update(1, Status.idle, discord.Status.idle)
+    tracker.update(3, Status.online, discord.Status.online)
+
+    assert len(tracker) == 2
+    assert tracker.get(2) is None
+    assert tracker.get(1) is Status.idle
+    assert tracker.evicted == 1
+
+
+def test_remove(clock):
+    tracker = PresenceTracker(window=2, max_users=10)
+    tracker.update(1, Status.online, discord.Status.online)
+    tracker.remove(1)
+    tracker.remove(1)
+
+    assert tracker.get(1) is None
+    assert not tracker.is_repeat(1, discord.Status.online)
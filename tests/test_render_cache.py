@@ -0,0 +1,56 @@
+from cogs.logging.render_cache import RenderCache
+
+
+def test_hit_and_miss(clock):
+    cache = RenderCache(ttl=60, max_bytes=100)
+    assert cache.get("pie", 1) is None
+    cache.put("pie", 1, b"image")
+
+    assert cache.get("pie", 1) == b"image"
+    # Kinds are separate namespaces
+    assert cache.get("log", 1) is None
+    assert cache.hits == {"pie": 1}
+    assert cache.misses == {"pie": 1, "log": 1}
+
+
+def test_entries_expire(clock):
+    cache = RenderCache(ttl=60, max_bytes=100)
+    cache.put("pie", 1, b"image")
+
+    clock[0] += 59
+    assert cache.get("pie", 1) == b"image"
+    clock[0] += 1
+    assert cache.get("pie", 1) is None
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def test_least_recently_used_are_evicted(clock):
+    cache = RenderCache(ttl=60, max_bytes=10)
+    cache.put("pie", 1, b"aaaa")
+    cache.put("pie", 2, b"bbbb")
+    cache.get("pie", 1)
+    cache.put("pie", 3, b"cccc")
+
+    assert cache.get("pie", 2) is None
+    assert cache.get("pie", 1) == b"aaaa"
+    assert cache.get("pie", 3) == b"cccc"
+    assert cache.bytes == 8
+    assert cache.evicted == 1
+
+
+def test_replacing_an_entry(clock):
+    cache = RenderCache(ttl=60, max_bytes=10)
+    cache.put("pie", 1, b"aaaa")
+    cache.put("pie", 1, b"bb")
+
+    assert cache.get("pie", 1) == b"bb"
+    assert cache.bytes == 2
+
+
+def test_oversized_images_are_not_cached(clock):
+    cache = RenderCache(ttl=60, max_bytes=4)
+    cache.put("pie", 1, b"aaaaa")
+
+    assert cache.get("pie", 1) is None
+    assert cache.bytes == 0
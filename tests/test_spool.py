@@ -0,0 +1,94 @@
+import asyncio
+import glob
+import os
+
+from cogs.logging.spool import HEADER, Spool
+
+
+RECORDS = [("status", (i, "online")) for i in range(5)]
+
+
+def segments(path):
+    return sorted(glob.glob(f"{path}.*[0-9]"))
+
+
+def write_records(path, records=RECORDS):
+    spool = Spool(path)
+    for name, values in records:
+        spool.write(name, values)
+    spool.close()
+
+
+def test_replay_after_restart(tmp_path):
+    path = str(tmp_path / "logging.spool")
+    write_records(path)
+
+    assert list(Spool(path).replay()) == RECORDS
+
+
+def test_replay_stops_at_torn_record(tmp_path):
+    path = str(tmp_path / "logging.spool")
+    write_records(path)
+
+    # The process died part way through writing the last record
+    (segment,) = segments(path)
+    os.truncate(segment, os.path.getsize(segment) - 3)
+
+    assert list(Spool(path).replay()) == RECORDS[:-1]
+
+
+def test_replay_stops_at_torn_header(tmp_path):
+    path = str(tmp_path / "logging.spool")
+    write_records(path)
+
+    (segment,) = segments(path)
+    with open(segment, "ab") as fp:
+        fp.write(HEADER.pack(100, 0)[:5])
+
+    assert list(Spool(path).replay()) == RECORDS
+
+
+def test_replay_stops_at_bad_checksum(tmp_path):
+    path = str(tmp_path / "logging.spool")
+    write_records(path)
+
+    (segment,) = segments(path)
+    with open(segment, "r+b") as fp:
+        length, _ = HEADER.unpack(fp.read(HEADER.size))
+        # Flip a byte in the payload of the second record
+        fp.seek(HEADER.size + length + HEADER.size)
+        byte = fp.read(1)
+        fp.seek(-1, os.SEEK_CUR)
+        fp.write(bytes([byte[0] ^ 0xFF]))
+
+    assert list(Spool(path).replay()) == RECORDS[:1]
+
+
+def test_release_removes_earlier_segments(tmp_path):
+    path = str(tmp_path / "logging.spool")
+
+    async def run():
+        spool = Spool(path)
+        spool.write(*RECORDS[0])
+        first = spool.rotate()
+        spool.write(*RECORDS[1])
+        second = spool.rotate()
+        spool.write(*RECORDS[2])
+
+        spool.release(second, after=first)
+        assert len(segments(path)) == 2
+        spool.release(second)
+        assert len(segments(path)) == 1
+        spool.close()
+
+    asyncio.run(run())
+    assert list(Spool(path).replay()) == RECORDS[2:3]
+
+
+def test_replayed_segments_are_not_replayed_twice(tmp_path):
+    path = str(tmp_path / "logging.spool")
+    write_records(path)
+
+    spool = Spool(path)
+    assert list(spool.replay()) == RECORDS
+    assert list(spool.replay()) == []